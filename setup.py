@@ -61,5 +61,6 @@ setup(
     entry_points='''
     [console_scripts]
     profile = mongopersist.performance:main
+    mongopersist-indexes = mongopersist.indexes:main
     ''',
 )
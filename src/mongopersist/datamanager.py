@@ -15,16 +15,18 @@
 from __future__ import absolute_import
 import UserDict
 import bson
+import itertools
 import logging
 import transaction
 import sys
 import zope.interface
 
 from zope.exceptions import exceptionformatter
-from mongopersist import conflict, interfaces, serialize
+from mongopersist import conflict, interfaces, prefetch, serialize
 
 MONGO_ACCESS_LOGGING = False
 COLLECTION_LOG = logging.getLogger('mongopersist.collection')
+PREFETCH_BATCH_SIZE = 100
 
 LOG = logging.getLogger(__name__)
 
@@ -39,6 +41,20 @@ def process_spec(collection, spec):
     return adapter.process(collection, spec)
 
 
+def get_path_references(state, names):
+    # Walk along the attribute path through the document state and return
+    # all references found on the way together with the names remaining
+    # after them.
+    if isinstance(state, bson.dbref.DBRef):
+        return [(state, names)]
+    if isinstance(state, (tuple, list)):
+        return [found for item in state
+                for found in get_path_references(item, names)]
+    if not names or not isinstance(state, dict):
+        return []
+    return get_path_references(state.get(names[0]), names[1:])
+
+
 class FlushDecorator(object):
 
     def __init__(self, datamanager, function):
@@ -118,20 +134,25 @@ class CollectionWrapper(object):
         self.__dict__['_datamanager'] = datamanager
 
     def find_objects(self, *args, **kw):
+        prefetch = kw.pop('prefetch', None)
         docs = self.find(*args, **kw)
         coll = self.collection.name
         dbname = self.collection.database.name
+        docs = self._datamanager.iter_prefetched(docs, prefetch, dbname, coll)
         for doc in docs:
             dbref = bson.dbref.DBRef(coll, doc['_id'], dbname)
             self._datamanager._latest_states[dbref] = doc
             yield self._datamanager.load(dbref)
 
     def find_one_object(self, *args, **kw):
+        prefetch = kw.pop('prefetch', None)
         doc = self.find_one(*args, **kw)
         coll = self.collection.name
         dbname = self.collection.database.name
         dbref = bson.dbref.DBRef(coll, doc['_id'], dbname)
         self._datamanager._latest_states[dbref] = doc
+        if prefetch:
+            self._datamanager.prefetch([doc], prefetch)
         return self._datamanager.load(dbref)
 
     def __getattr__(self, name):
@@ -164,29 +185,47 @@ class Root(UserDict.DictMixin):
             self.collection = collection
         db = self._jar._conn[self.database]
         self._collection_inst = CollectionWrapper(db[self.collection], jar)
+        # The references of the looked up names. Other connections may
+        # rebind a name at any time, so the cache is cleared whenever the
+        # data manager is reset at the end of a transaction.
+        self._cache = {}
 
     def __getitem__(self, key):
-        doc = self._collection_inst.find_one({'name': key})
-        if doc is None:
-            raise KeyError(key)
-        return self._jar.load(doc['ref'])
+        dbref = self._cache.get(key)
+        if dbref is None:
+            doc = self._collection_inst.find_one({'name': key}, fields=('ref',))
+            if doc is None:
+                raise KeyError(key)
+            dbref = self._cache[key] = doc['ref']
+        return self._jar.load(dbref)
 
     def __setitem__(self, key, value):
         dbref = self._jar.insert(value)
-        if self.get(key) is not None:
-            del self[key]
-        doc = {'ref': dbref, 'name': key}
-        self._collection_inst.insert(doc)
+        # Replace the reference using a single upsert; the old document is
+        # returned, so that the previous object can be removed.
+        doc = self._collection_inst.find_and_modify(
+            {'name': key}, {'$set': {'ref': dbref}}, upsert=True)
+        self._cache[key] = dbref
+        # Some servers return an empty document, when a new one was inserted.
+        old_ref = (doc or {}).get('ref')
+        if old_ref is not None and old_ref != dbref:
+            self._remove_ref(old_ref)
 
     def __delitem__(self, key):
-        doc = self._collection_inst.find_one({'name': key})
-        coll = self._jar.get_collection(
-            doc['ref'].database, doc['ref'].collection)
-        coll.remove(doc['ref'].id)
-        self._collection_inst.remove({'name': key})
+        self._cache.pop(key, None)
+        doc = self._collection_inst.find_and_modify(
+            {'name': key}, remove=True)
+        if not doc:
+            raise KeyError(key)
+        self._remove_ref(doc['ref'])
+
+    def _remove_ref(self, dbref):
+        coll = self._jar.get_collection(dbref.database, dbref.collection)
+        coll.remove(dbref.id)
 
     def keys(self):
-        return [doc['name'] for doc in self._collection_inst.find()]
+        return [doc['name']
+                for doc in self._collection_inst.find({}, fields=('name',))]
 
 
 class MongoDataManager(object):
@@ -220,6 +259,8 @@ class MongoDataManager(object):
         self._latest_states = {}
         self._needs_to_join = True
         self._object_cache = {}
+        # The item caches of the containers used in the transaction.
+        self._container_caches = {}
         self.annotations = {}
         if self.conflict_handler is None:
             self.conflict_handler = conflict_handler_factory(self)
@@ -281,10 +322,160 @@ class MongoDataManager(object):
     def load(self, dbref, klass=None):
         return self._reader.get_ghost(dbref, klass)
 
+    def load_states(self, dbrefs):
+        # Read the documents of all given references that are neither known
+        # nor loaded yet, using one query per collection.
+        missing = {}
+        for dbref in dbrefs:
+            if dbref in self._latest_states:
+                continue
+            obj = self._object_cache.get(hash(dbref))
+            if obj is not None and obj._p_changed is not None:
+                # The object is already active.
+                continue
+            missing.setdefault(
+                (dbref.database, dbref.collection), []).append(dbref.id)
+        for (db_name, coll_name), ids in missing.items():
+            coll = self.get_collection(db_name, coll_name)
+            for doc in coll.find({'_id': {'$in': ids}}):
+                dbref = bson.dbref.DBRef(coll_name, doc['_id'], db_name)
+                self._latest_states[dbref] = doc
+
+    def prefetch(self, docs, paths):
+        # Every level of the attribute paths is handled with a single query
+        # per collection.
+        todo = [(doc, path.split('.')) for doc in docs for path in paths]
+        while todo:
+            found = []
+            for state, names in todo:
+                found.extend(get_path_references(state, names))
+            self.load_states([dbref for dbref, names in found])
+            todo = [(self._latest_states[dbref], names)
+                    for dbref, names in found
+                    if names and dbref in self._latest_states]
+
+    def iter_prefetched(self, docs, paths, db_name=None, coll_name=None):
+        learn = prefetch.LEARN_REFERENCES and coll_name is not None
+        if not paths and not learn:
+            for doc in docs:
+                yield doc
+            return
+        # Prefetch the references of a whole batch of documents before
+        # handing them out.
+        docs = iter(docs)
+        while True:
+            batch = list(itertools.islice(docs, PREFETCH_BATCH_SIZE))
+            if not batch:
+                break
+            if paths:
+                self.prefetch(batch, paths)
+            if learn:
+                self._prefetch_learned(
+                    batch, db_name or self.default_database, coll_name)
+            for doc in batch:
+                yield doc
+
+    def _prefetch_learned(self, docs, db_name, coll_name):
+        dbrefs = []
+        for doc in docs:
+            dbref = bson.dbref.DBRef(coll_name, doc['_id'], db_name)
+            # The documents are about to be loaded anyways, so they can also
+            # be used to resolve the classes without a query.
+            self._latest_states[dbref] = doc
+            dbrefs.append(dbref)
+        learned = {}
+        by_paths = {}
+        for klass, doc in zip(self._reader.resolve_many(dbrefs), docs):
+            prefetch.STATISTICS.record_load(klass, doc)
+            if klass not in learned:
+                learned[klass] = prefetch.STATISTICS.get_paths(klass)
+            if learned[klass]:
+                by_paths.setdefault(learned[klass], []).append(doc)
+        for paths, path_docs in by_paths.items():
+            self.prefetch(path_docs, paths)
+
+    def load_many(self, dbrefs, activate=True):
+        dbrefs = list(dbrefs)
+        if activate:
+            self.load_states(dbrefs)
+        # Only resolve the classes of objects that are not cached yet.
+        new = [dbref for dbref in dbrefs
+               if hash(dbref) not in self._object_cache]
+        classes = dict(zip([hash(dbref) for dbref in new],
+                           self._reader.resolve_many(new)))
+        objs = []
+        for dbref in dbrefs:
+            obj = self._reader.get_ghost(dbref, classes.get(hash(dbref)))
+            if activate:
+                # The state is taken from the latest states, so that no
+                # further query is needed.
+                obj._p_activate()
+            objs.append(obj)
+        return objs
+
+    def get_query_types(self, klass):
+        """Return the collection of the class and the types to query.
+
+        The paths are the types stored in the documents of the class and its
+        subclasses, or ``None`` if all documents of the collection are
+        instances of them. The untyped class is the class of the documents
+        without a stored type, if it is one of them.
+        """
+        db_name = getattr(klass, '_p_mongo_database', self.default_database)
+        coll_name = getattr(
+            klass, '_p_mongo_collection', serialize.get_dotted_name(klass))
+        paths = []
+        untyped = None
+        all_match = True
+        coll = self._conn[self.default_database][self.name_map_collection]
+        for map in coll.find({'collection': coll_name, 'database': db_name}):
+            try:
+                map_klass = self._reader.simple_resolve(map['path'])
+            except ImportError:
+                map_klass = None
+            if map_klass is None or not issubclass(map_klass, klass):
+                all_match = False
+                continue
+            paths.append(map['path'])
+            if not map.get('doc_has_type'):
+                untyped = map_klass
+        if all_match:
+            paths = None
+        return db_name, coll_name, paths, untyped
+
+    def query(self, klass, spec=None, **kwargs):
+        """Return the objects of the class and its subclasses matching the
+        spec.
+
+        In collections shared by several classes the query is restricted by
+        the stored type, which should be indexed. The classes of the found
+        objects are taken from the documents.
+        """
+        db_name, coll_name, paths, untyped = self.get_query_types(klass)
+        spec = dict(spec or {})
+        if paths is not None:
+            type_spec = {'_py_persistent_type': {'$in': paths}}
+            if untyped is not None:
+                type_spec = {'$or': [
+                    type_spec, {'_py_persistent_type': {'$exists': False}}]}
+            spec = {'$and': [spec, type_spec]} if spec else type_spec
+        coll = self.get_collection(db_name, coll_name)
+        for doc in coll.find(spec, **kwargs):
+            dbref = bson.dbref.DBRef(coll_name, doc['_id'], db_name)
+            self._latest_states[dbref] = doc
+            if '_py_persistent_type' in doc:
+                doc_klass = self._reader.simple_resolve(
+                    doc['_py_persistent_type'])
+            else:
+                doc_klass = untyped or klass
+            obj = self._reader.get_ghost(dbref, doc_klass)
+            yield obj
+
     def reset(self):
         root = self.root
         self.__init__(self._conn)
         self.root = root
+        root._cache.clear()
 
     def flush(self):
         # Check for conflicts.
@@ -297,40 +488,140 @@ class MongoDataManager(object):
             obj._p_changed = False
         self._registered_objects = {}
 
-    def insert(self, obj, oid=None):
+    def insert(self, obj, oid=None, safe=False):
         if obj._p_oid is not None:
             raise ValueError('Object has already an OID.', obj)
-        res = self._writer.store(obj, id=oid)
+        registered = set(self._registered_objects)
+        try:
+            res = self._writer.store(obj, id=oid, safe=safe)
+        except:
+            self._unstore_new_objects(registered)
+            raise
         obj._p_changed = False
         self._object_cache[hash(obj._p_oid)] = obj
         self._inserted_objects[id(obj)] = obj
         return res
 
+    def _unstore_new_objects(self, registered):
+        # New sub-objects are stored to get a reference and registered to be
+        # written fully later. When storing the referencing object fails, the
+        # documents would be left behind, so they are removed again.
+        for key, obj in self._registered_objects.items():
+            if key in registered or obj._p_oid is None:
+                continue
+            del self._registered_objects[key]
+            coll = self.get_collection_from_object(obj)
+            coll.remove({'_id': obj._p_oid.id})
+            self._object_cache.pop(hash(obj._p_oid), None)
+            obj._p_jar = None
+            obj._p_oid = None
+
+    def insert_many(self, objs, ids=None):
+        objs = list(objs)
+        for obj in objs:
+            if obj._p_oid is not None:
+                raise ValueError('Object has already an OID.', obj)
+        res = self._writer.insert_many(objs, ids)
+        for obj in objs:
+            obj._p_changed = False
+            self._inserted_objects[id(obj)] = obj
+        return res
+
     def remove(self, obj):
+        if type(obj) is serialize.ReferenceProxy:
+            # Track the persistent object, not the proxy standing in for it.
+            obj = obj._m_get_object()
         if obj._p_oid is None:
             raise ValueError('Object does not have OID.', obj)
         # If the object is still in the ghost state, let's load it, so that we
         # have the state in case we abort the transaction later.
         if obj._p_changed is None:
             self.setstate(obj)
+        dependents = self._get_dependents([obj])
         # Now we remove the object from Mongo.
         coll = self.get_collection_from_object(obj)
         coll.remove({'_id': obj._p_oid.id})
-        if hash(obj._p_oid) in self._object_cache:
+        self._forget_removed([obj])
+        if dependents:
+            self.remove_many(dependents)
+
+    def remove_many(self, objs):
+        objs = [obj._m_get_object()
+                if type(obj) is serialize.ReferenceProxy else obj
+                for obj in objs]
+        for obj in objs:
+            if obj._p_oid is None:
+                raise ValueError('Object does not have OID.', obj)
+        # Load the states of all ghosts with one query per collection, so
+        # that we have them in case we abort the transaction later.
+        ghosts = [obj for obj in objs if obj._p_changed is None]
+        self.load_states([obj._p_oid for obj in ghosts])
+        for obj in ghosts:
+            self.setstate(obj)
+        dependents = self._get_dependents(objs)
+        ids = {}
+        for obj in objs:
+            ids.setdefault(
+                (obj._p_oid.database, obj._p_oid.collection), []
+                ).append(obj._p_oid.id)
+        for (db_name, coll_name), coll_ids in ids.items():
+            coll = self.get_collection(db_name, coll_name)
+            coll.remove({'_id': {'$in': coll_ids}})
+        self._forget_removed(objs)
+        if dependents:
+            self.remove_many(dependents)
+
+    def _get_dependents(self, objs):
+        # Objects spreading their state over further documents return those,
+        # so that they are not left behind when the object is removed.
+        dependents = []
+        for obj in objs:
+            get_dependents = getattr(obj, '_p_mongo_get_dependents', None)
+            if get_dependents is not None:
+                dependents.extend(dep for dep in get_dependents()
+                                  if dep._p_oid is not None)
+        return dependents
+
+    def release(self, obj):
+        # Unmodified objects are turned into ghosts and forgotten, so that
+        # they can be garbage collected. When used again, they are reloaded
+        # from the database.
+        if (obj._p_oid is None or obj._p_changed or
+                id(obj) in self._registered_objects or
+                id(obj) in self._inserted_objects or
+                id(obj) in self._removed_objects):
+            return False
+        if self._object_cache.get(hash(obj._p_oid)) is obj:
             del self._object_cache[hash(obj._p_oid)]
-
-        # Edge case: The object was just added in this transaction.
-        if id(obj) in self._inserted_objects:
-            # but it still had to be removed from mongo, because insert
-            # inserted it just before
-            del self._inserted_objects[id(obj)]
-
-        self._removed_objects[id(obj)] = obj
+        self._loaded_objects.pop(id(obj), None)
+        self._original_states.pop(obj._p_oid, None)
+        self._latest_states.pop(obj._p_oid, None)
+        if obj._p_changed is not None:
+            # Keep the volatile attributes, like the location of the object.
+            volatile = [(name, value) for name, value in obj.__dict__.items()
+                        if name.startswith('_v_')]
+            obj._p_deactivate()
+            obj.__dict__.update(volatile)
+        return True
+
+    def _forget_removed(self, objs):
+        for obj in objs:
+            if hash(obj._p_oid) in self._object_cache:
+                del self._object_cache[hash(obj._p_oid)]
+
+            # Edge case: The object was just added in this transaction.
+            if id(obj) in self._inserted_objects:
+                # but it still had to be removed from mongo, because insert
+                # inserted it just before
+                del self._inserted_objects[id(obj)]
+
+            self._removed_objects[id(obj)] = obj
         # Just in case the object was modified before removal, let's remove it
         # from the modification list. Note that all sub-objects need to be
         # deleted too!
+        removed = set(id(obj) for obj in objs)
         for key, reg_obj in self._registered_objects.items():
-            if self._get_doc_object(reg_obj) is obj:
+            if id(self._get_doc_object(reg_obj)) in removed:
                 del self._registered_objects[key]
         # We are not doing anything fancy here, since the object might be
         # added again with some different state.
@@ -348,6 +639,8 @@ class MongoDataManager(object):
         # _latest_states dictionary.
         if doc is None:
             doc = self._latest_states.get(obj._p_oid, None)
+        if prefetch.LEARN_REFERENCES:
+            prefetch.STATISTICS.record_use(obj._p_oid)
         self._reader.set_ghost_state(obj, doc)
         self._loaded_objects[id(obj)] = obj
 
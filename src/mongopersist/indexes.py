@@ -0,0 +1,225 @@
+##############################################################################
+#
+# Copyright (c) 2013 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Declarative Mongo Index Management
+
+Index declarations are either a field name, a list of ``(field, direction)``
+pairs or a ``(keys, options)`` tuple, where the options are passed to
+``create_index()``, for example ``([('name', 1)], {'unique': True})``.
+"""
+from __future__ import absolute_import
+import optparse
+import pymongo
+import sys
+import transaction
+from zope.dottedname.resolve import resolve
+
+from mongopersist import datamanager, interfaces, serialize
+
+ROOT_INDEXES = (('name', {'unique': True}),)
+NAME_MAP_INDEXES = ([('collection', 1), ('database', 1)],)
+TYPE_INDEXES = ('_py_persistent_type',)
+# The index options that change the semantics of an index.
+SEMANTIC_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds')
+
+
+def normalize_index(spec):
+    options = {}
+    if isinstance(spec, tuple) and len(spec) == 2 and \
+            isinstance(spec[1], dict):
+        spec, options = spec
+    if isinstance(spec, basestring):
+        spec = [(spec, pymongo.ASCENDING)]
+    return [tuple(key) for key in spec], options
+
+
+def get_class_collection(dm, klass):
+    return (getattr(klass, '_p_mongo_database', dm.default_database),
+            getattr(klass, '_p_mongo_collection',
+                    serialize.get_dotted_name(klass)))
+
+
+def get_class_indexes(klass):
+    indexes = list(getattr(klass, '_p_mongo_indexes', ()))
+    if getattr(klass, '_p_mongo_store_type', False):
+        indexes.extend(TYPE_INDEXES)
+    return indexes
+
+
+def get_type_collections(dm):
+    # Collections with more than one class mapped to them store the type of
+    # their documents.
+    coll = dm._conn[dm.default_database][dm.name_map_collection]
+    counts = {}
+    for doc in coll.find():
+        key = (doc['database'], doc['collection'])
+        counts[key] = counts.get(key, 0) + 1
+    return sorted(key for key, count in counts.items() if count > 1)
+
+
+def get_indexes(dm, classes=(), containers=()):
+    indexes = {}
+    def add(coll_key, specs):
+        coll_indexes = indexes.setdefault(coll_key, [])
+        for spec in specs:
+            index = normalize_index(spec)
+            if index not in coll_indexes:
+                coll_indexes.append(index)
+
+    add((dm.root.database, dm.root.collection), ROOT_INDEXES)
+    add((dm.default_database, dm.name_map_collection), NAME_MAP_INDEXES)
+    for coll_key in get_type_collections(dm):
+        add(coll_key, TYPE_INDEXES)
+    for klass in classes:
+        add(get_class_collection(dm, klass), get_class_indexes(klass))
+    for container in containers:
+        add((container._m_database or dm.default_database,
+             container._m_collection),
+            container._m_get_indexes())
+    return indexes
+
+
+def get_redundant_indexes(info):
+    """Return the indexes that are a prefix of another index.
+
+    Unique and sparse indexes are never redundant, since they change
+    semantics.
+    """
+    redundant = []
+    for name, index in sorted(info.items()):
+        if name == '_id_' or index.get('unique') or index.get('sparse'):
+            continue
+        keys = list(index['key'])
+        for other_name, other in sorted(info.items()):
+            other_keys = list(other['key'])
+            if other_name != name and len(other_keys) > len(keys) and \
+                    other_keys[:len(keys)] == keys:
+                redundant.append((name, other_name))
+                break
+    return redundant
+
+
+def get_option_mismatches(options, info):
+    """Return the semantic options that differ between a declaration and the
+    information of an existing index as ``(name, declared, existing)``.
+    """
+    mismatches = []
+    for name in SEMANTIC_OPTIONS:
+        declared = options.get(name) or None
+        existing = info.get(name) or None
+        if declared != existing:
+            mismatches.append((name, declared, existing))
+    return mismatches
+
+
+def ensure_indexes(dm, classes=(), containers=()):
+    """Create all missing declared indexes.
+
+    Returns a tuple of the created indexes and the redundant indexes found in
+    the affected collections. If an existing index has the keys of a
+    declaration, but different options, for example it is not unique, an
+    ``IndexMismatchError`` listing all such indexes is raised before any
+    index is created, since the index has to be migrated by hand.
+    """
+    declared = sorted(get_indexes(dm, classes, containers).items())
+    todo = []
+    mismatched = []
+    for (db_name, coll_name), indexes in declared:
+        coll = dm._conn[db_name][coll_name]
+        existing = dict((tuple(info['key']), (name, info))
+                        for name, info in coll.index_information().items())
+        for keys, options in indexes:
+            if tuple(keys) not in existing:
+                todo.append((coll, db_name, coll_name, keys, options))
+                # Conflicting declarations of the same keys are mismatches
+                # as well.
+                existing[tuple(keys)] = (None, options)
+                continue
+            name, info = existing[tuple(keys)]
+            for mismatch in get_option_mismatches(options, info):
+                mismatched.append((db_name, coll_name, name) + mismatch)
+    if mismatched:
+        raise interfaces.IndexMismatchError(mismatched)
+
+    created = []
+    for coll, db_name, coll_name, keys, options in todo:
+        name = coll.create_index(keys, **options)
+        created.append((db_name, coll_name, name))
+    redundant = []
+    for (db_name, coll_name), indexes in declared:
+        coll = dm._conn[db_name][coll_name]
+        for name, other_name in get_redundant_indexes(
+                coll.index_information()):
+            redundant.append((db_name, coll_name, name, other_name))
+    return created, redundant
+
+
+parser = optparse.OptionParser()
+parser.usage = '%prog [options] [dotted class name ...]'
+
+parser.add_option(
+    '--host', action='store', dest='host', default='localhost',
+    help='The host of the Mongo server.')
+
+parser.add_option(
+    '--port', action='store', type='int', dest='port', default=27017,
+    help='The port of the Mongo server.')
+
+parser.add_option(
+    '-d', '--database', action='store', dest='database', default=None,
+    help='The default database.')
+
+parser.add_option(
+    '--root-database', action='store', dest='root_database', default=None,
+    help='The database of the root collection.')
+
+parser.add_option(
+    '--root-collection', action='store', dest='root_collection',
+    default=None, help='The root collection.')
+
+parser.add_option(
+    '-r', '--root-item', action='append', dest='root_items', default=[],
+    help='The name of a container in the root whose indexes are ensured. '
+         'Can be used multiple times.')
+
+
+def main(args=None):
+    # Parse command line options.
+    if args is None:
+        args = sys.argv[1:]
+    options, args = parser.parse_args(args)
+
+    conn = pymongo.MongoClient(options.host, options.port)
+    dm = datamanager.MongoDataManager(
+        conn,
+        default_database=options.database,
+        root_database=options.root_database,
+        root_collection=options.root_collection)
+    classes = [resolve(name) for name in args]
+    containers = [dm.root[name] for name in options.root_items]
+    try:
+        created, redundant = ensure_indexes(dm, classes, containers)
+    except interfaces.IndexMismatchError, err:
+        for db_name, coll_name, name, option, declared, existing in \
+                err.args[0]:
+            print 'Mismatched index %s on %s.%s (%s is %r, declared %r)' % (
+                name, db_name, coll_name, option, existing, declared)
+        sys.exit(1)
+    finally:
+        transaction.abort()
+
+    for db_name, coll_name, name in created:
+        print 'Created index %s on %s.%s' % (name, db_name, coll_name)
+    for db_name, coll_name, name, other_name in redundant:
+        print 'Redundant index %s on %s.%s (covered by %s)' % (
+            name, db_name, coll_name, other_name)
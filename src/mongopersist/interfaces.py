@@ -73,6 +73,10 @@ class CircularReferenceError(Exception):
     pass
 
 
+class IndexMismatchError(Exception):
+    """Existing indexes have the declared keys, but different options."""
+
+
 class IConflictHandler(zope.interface.Interface):
 
     datamanager = zope.interface.Attribute(
@@ -163,12 +167,16 @@ class IObjectWriter(zope.interface.Interface):
         detected.
         """
 
-    def store(obj, id=None):
+    def store(obj, id=None, safe=False):
         """Store an object in the database with given id
 
-        If id is not specified, unique one will be generated
+        If id is not specified, unique one will be generated. If safe is
+        true, inserting a new object is acknowledged by the server.
         """
 
+    def insert_many(objs, ids=None):
+        """Insert many new objects with one insert per collection."""
+
 
 class IObjectReader(zope.interface.Interface):
     """The object reader reads an object from the database."""
@@ -180,6 +188,14 @@ class IObjectReader(zope.interface.Interface):
         to maintain the mapping from path to class.
         """
 
+    def resolve_many(dbrefs):
+        """Resolve many references to their classes at once.
+
+        Documents that are needed to determine the classes are read with one
+        query per collection. The classes are returned in the order of the
+        references.
+        """
+
     def get_object(state, obj):
         """Get an object from the given state.
 
@@ -223,22 +239,92 @@ class IMongoDataManager(persistent.interfaces.IPersistentDataManager):
         Note: The returned object is in the ghost state.
         """
 
+    def load_states(dbrefs):
+        """Read the documents of many references into the latest states.
+
+        Only documents that are not known yet are read, using a single query
+        per collection.
+        """
+
+    def prefetch(docs, paths):
+        """Pre-load the documents referenced by the given documents.
+
+        The paths are dotted attribute paths, for example ``'address'`` or
+        ``'owner.company'``. All references found along the paths are read
+        into the latest states with one query per collection and path level.
+        """
+
+    def iter_prefetched(docs, paths, db_name=None, coll_name=None):
+        """Iterate over the documents, prefetching references in batches.
+
+        Besides the explicitly given paths, the references learned by
+        ``mongopersist.prefetch`` are prefetched, if the collection of the
+        documents is given and learning is enabled.
+        """
+
+    def load_many(dbrefs, activate=True):
+        """Load many objects from Mongo by their DBRefs.
+
+        The objects are returned in the order of the references. If
+        ``activate`` is true, all missing documents are read with a single
+        query per collection and the objects are activated.
+        """
+
+    def query(klass, spec=None, **kwargs):
+        """Return an iterator of the objects of the class and its subclasses
+        matching the spec.
+
+        The objects are looked up in the collection of the class. If other
+        classes share the collection, the query is restricted by the stored
+        ``_py_persistent_type``. The classes of the objects are known from
+        the query, so they do not need to be resolved one by one.
+        """
+
     def flush():
         """Flush all changes to Mongo."""
 
-    def insert(obj, id=None):
+    def insert(obj, id=None, safe=False):
         """Insert an object into Mongo.
 
         The correct collection is determined by object type.
 
         If `id` is provided, object will be inserted under that id. Otherwise,
         new unique id will be generated.
+
+        If `safe` is true, the insert is acknowledged by the server, so that
+        errors like duplicate keys are raised.
+        """
+
+    def insert_many(objs, ids=None):
+        """Insert many new objects into Mongo.
+
+        The objects are inserted with a single insert per collection. The
+        optional ``ids`` are used as the ids of the objects. Returns the
+        DBRefs of the objects.
         """
 
     def remove(obj):
         """Remove an object from Mongo.
 
-        The correct collection is determined by object type.
+        The correct collection is determined by object type. If the object
+        has a ``_p_mongo_get_dependents()`` method, the stored objects it
+        returns are removed as well.
+        """
+
+    def remove_many(objs):
+        """Remove many objects from Mongo.
+
+        The objects are removed with a single query per collection. Dependent
+        objects are removed like in ``remove()``.
+        """
+
+    def release(obj):
+        """Forget an unmodified object for the rest of the transaction.
+
+        The object is turned into a ghost and neither it nor its states are
+        kept by the data manager, so that it can be garbage collected. Loading
+        the document again creates a new object. Returns whether the object
+        was released; modified, new and removed objects are kept.
         """
 
 
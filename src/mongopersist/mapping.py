@@ -24,6 +24,8 @@ class MongoCollectionMapping(UserDict.DictMixin, object):
 
     def __init__(self, jar):
         self._m_jar = jar
+        self._m_cache_txn = None
+        self._m_cache = {}
 
     def __mongo_filter__(self):
         return {}
@@ -32,17 +34,63 @@ class MongoCollectionMapping(UserDict.DictMixin, object):
         db_name = self.__mongo_database__ or self._m_jar.default_database
         return self._m_jar.get_collection(db_name, self.__mongo_collection__)
 
+    def _get_cache(self):
+        # The key to reference cache is only valid for the transaction.
+        txn = self._m_jar.transaction_manager.get()
+        if self._m_cache_txn is not txn:
+            self._m_cache_txn = txn
+            self._m_cache = {}
+        return self._m_cache
+
+    def _load(self, doc, cache, full=False):
+        db_name = self.__mongo_database__ or self._m_jar.default_database
+        dbref = bson.dbref.DBRef(
+            self.__mongo_collection__, doc['_id'], db_name)
+        cache[doc[self.__mongo_mapping_key__]] = dbref
+        if full:
+            # Keep the document, so that the object can be activated without
+            # another query.
+            self._m_jar._latest_states.setdefault(dbref, doc)
+        return self._m_jar._reader.get_ghost(dbref)
+
+    def _find(self, filter, fields=None):
+        filter.update(self.__mongo_filter__())
+        if self.__mongo_mapping_key__ not in filter:
+            filter[self.__mongo_mapping_key__] = {'$ne': None}
+        return self.get_mongo_collection().find(filter, fields=fields)
+
     def __getitem__(self, key):
+        cache = self._get_cache()
+        dbref = cache.get(key)
+        if dbref is not None:
+            return self._m_jar._reader.get_ghost(dbref)
         filter = self.__mongo_filter__()
         filter[self.__mongo_mapping_key__] = key
         coll = self.get_mongo_collection()
         doc = coll.find_one(filter)
         if doc is None:
             raise KeyError(key)
-        db_name = self.__mongo_database__ or self._m_jar.default_database
-        dbref = bson.dbref.DBRef(
-            self.__mongo_collection__, doc['_id'], db_name)
-        return self._m_jar._reader.get_ghost(dbref)
+        return self._load(doc, cache)
+
+    def get_many(self, keys):
+        """Return a dictionary of the found objects by key.
+
+        All keys that are not cached are looked up with a single query.
+        """
+        cache = self._get_cache()
+        result = {}
+        missing = []
+        for key in keys:
+            if key in cache:
+                result[key] = self._m_jar._reader.get_ghost(cache[key])
+            else:
+                missing.append(key)
+        if missing:
+            filter = {self.__mongo_mapping_key__: {'$in': missing}}
+            for doc in self._find(filter):
+                result[doc[self.__mongo_mapping_key__]] = self._load(
+                    doc, cache, full=True)
+        return result
 
     def __setitem__(self, key, value):
         # Even though setting the attribute should register the object with
@@ -50,17 +98,45 @@ class MongoCollectionMapping(UserDict.DictMixin, object):
         # point, so registering it manually ensures that new objects get added.
         self._m_jar.register(value)
         setattr(value, self.__mongo_mapping_key__, key)
+        cache = self._get_cache()
+        if value._p_oid is not None:
+            cache[key] = value._p_oid
+        else:
+            cache.pop(key, None)
 
     def __delitem__(self, key):
         # Deleting the object from the database is not our job. We simply
         # remove it from the dictionary.
         value = self[key]
         setattr(value, self.__mongo_mapping_key__, None)
+        self._get_cache().pop(key, None)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
 
     def keys(self):
-        filter = self.__mongo_filter__()
-        filter[self.__mongo_mapping_key__] = {'$ne': None}
-        coll = self.get_mongo_collection()
-        return [
-            doc[self.__mongo_mapping_key__]
-            for doc in coll.find(filter)]
+        # Only the mapping key of the documents is needed.
+        return [doc[self.__mongo_mapping_key__]
+                for doc in self._find({}, fields=(self.__mongo_mapping_key__,))]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iteritems(self):
+        cache = self._get_cache()
+        for doc in self._find({}):
+            yield (doc[self.__mongo_mapping_key__],
+                   self._load(doc, cache, full=True))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [obj for key, obj in self.iteritems()]
+
+    def __len__(self):
+        return self._find({}).count()
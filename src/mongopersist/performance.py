@@ -128,6 +128,34 @@ class PerformanceBase(object):
         transaction.commit()
         self.printResult('Read (list.values)', t1, t2, peopleCnt)
 
+    def read_list_items(self, people, peopleCnt):
+        # Profile fast read (items)
+        transaction.begin()
+        t1 = time.time()
+        if PROFILE:
+            cProfile.runctx(
+                '[p for p in list(people.items())]', globals(), locals(),
+                filename=self.profile_output+'_read_list_items')
+        else:
+            [p for p in list(people.items())]
+        t2 = time.time()
+        transaction.commit()
+        self.printResult('Read (list.items)', t1, t2, peopleCnt)
+
+    def length(self, people, peopleCnt):
+        # Profile container length
+        transaction.begin()
+        t1 = time.time()
+        if PROFILE:
+            cProfile.runctx(
+                'len(people)', globals(), locals(),
+                filename=self.profile_output+'_length')
+        else:
+            len(people)
+        t2 = time.time()
+        transaction.commit()
+        self.printResult('Length', t1, t2)
+
     def fast_read_values(self, people, peopleCnt):
         # Profile fast read (values)
         transaction.begin()
@@ -230,6 +258,8 @@ class PerformanceBase(object):
         self.slow_read(people, peopleCnt)
         self.read_list(people, peopleCnt)
         self.read_list_values(people, peopleCnt)
+        self.read_list_items(people, peopleCnt)
+        self.length(people, peopleCnt)
         self.fast_read_values(people, peopleCnt)
         self.fast_read(people, peopleCnt)
         self.object_caching(people, peopleCnt)
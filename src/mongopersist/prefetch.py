@@ -0,0 +1,107 @@
+##############################################################################
+#
+# Copyright (c) 2013 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Learned Reference Prefetching"""
+from __future__ import absolute_import
+import bson.dbref
+import repoze.lru
+
+from mongopersist import serialize
+
+# When set, bulk loads record which references of the loaded objects are used
+# later and prefetch the ones that are used often.
+LEARN_REFERENCES = False
+# The ratio of uses to loads at which an attribute is prefetched.
+THRESHOLD = 0.5
+# The amount of loads of an attribute needed before any decision is made.
+MIN_SAMPLES = 50
+# The amount of loaded references that are remembered until they are used.
+MAX_TRACKED_REFERENCES = 10000
+# The amount of class attributes for which statistics are kept.
+MAX_ATTRIBUTES = 1000
+
+
+class ReferenceStatistics(object):
+    """Statistics about the use of references after bulk loads.
+
+    The counters are not protected by a lock, since being off by a few counts
+    does not change the outcome.
+    """
+
+    def __init__(self, max_tracked=None, max_attributes=None):
+        if max_tracked is None:
+            max_tracked = MAX_TRACKED_REFERENCES
+        if max_attributes is None:
+            max_attributes = MAX_ATTRIBUTES
+        self.max_attributes = max_attributes
+        # The origin (class, attribute) of every reference that was loaded
+        # but not used yet.
+        self._origins = repoze.lru.LRUCache(max_tracked)
+        # (class, attribute) -> [loads, uses]
+        self._counts = {}
+
+    def _get_counts(self, klass, name):
+        counts = self._counts.get((klass, name))
+        if counts is None and len(self._counts) < self.max_attributes:
+            counts = self._counts.setdefault((klass, name), [0, 0])
+        return counts
+
+    def record_load(self, klass, doc):
+        for name, value in doc.items():
+            if isinstance(value, bson.dbref.DBRef):
+                refs = [value]
+            elif isinstance(value, list):
+                refs = [item for item in value
+                        if isinstance(item, bson.dbref.DBRef)]
+            else:
+                continue
+            if not refs:
+                continue
+            counts = self._get_counts(klass, name)
+            if counts is None:
+                continue
+            counts[0] += 1
+            for ref in refs:
+                self._origins.put(ref, (klass, name))
+
+    def record_use(self, dbref):
+        origin = self._origins.get(dbref)
+        if origin is None:
+            return
+        # Only count the first use of a loaded reference.
+        self._origins.invalidate(dbref)
+        counts = self._counts.get(origin)
+        if counts is not None:
+            counts[1] += 1
+
+    def is_learned(self, counts):
+        loads, uses = counts
+        return loads >= MIN_SAMPLES and uses >= loads * THRESHOLD
+
+    def get_paths(self, klass):
+        return tuple(sorted(
+            name for (counts_klass, name), counts in self._counts.items()
+            if counts_klass is klass and self.is_learned(counts)))
+
+    def report(self):
+        return sorted(
+            (serialize.get_dotted_name(klass), name, loads, uses,
+             self.is_learned([loads, uses]))
+            for (klass, name), (loads, uses) in self._counts.items())
+
+    def clear(self):
+        self._origins.clear()
+        self._counts.clear()
+
+
+STATISTICS = ReferenceStatistics()
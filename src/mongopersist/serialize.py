@@ -32,6 +32,7 @@ from mongopersist import interfaces
 
 IGNORE_IDENTICAL_DOCUMENTS = True
 ALWAYS_READ_FULL_DOC = True
+DEFER_CLASS_RESOLUTION = False
 
 SERIALIZERS = []
 OID_CLASS_LRU = repoze.lru.LRUCache(20000)
@@ -77,6 +78,266 @@ class PersistentList(persistent.list.PersistentList):
     _p_mongo_sub_object = True
 
 
+class ListChunk(persistent.Persistent):
+    """A document holding a slice of the items of a chunked list."""
+
+    def __init__(self, data=()):
+        self.data = list(data)
+
+    def __setstate__(self, state):
+        # Work with a plain list, the chunk is marked as changed explicitly.
+        state = dict(state)
+        state['data'] = list(state.get('data', []))
+        super(ListChunk, self).__setstate__(state)
+
+
+class ChunkedPersistentList(persistent.Persistent):
+    """A list storing its items in chunk documents of a fixed size.
+
+    Indexing, slicing, ``len()`` and appending only load and write the chunks
+    involved, so long lists, for example logs, stay cheap to load. Inserting
+    and deleting items rewrites the chunks following the changed index.
+    """
+    chunk_size = 1000
+
+    def __init__(self, data=(), chunk_size=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.chunks = []
+        self.extend(data)
+
+    def __setstate__(self, state):
+        # Work with a plain list, the list is marked as changed explicitly.
+        state = dict(state)
+        state['chunks'] = list(state.get('chunks', []))
+        super(ChunkedPersistentList, self).__setstate__(state)
+
+    def _load_chunks(self, chunks):
+        # Load the states of all chunk ghosts with a single query.
+        if interfaces.IMongoDataManager.providedBy(self._p_jar):
+            self._p_jar.load_states([chunk._p_oid for chunk in chunks
+                                     if chunk._p_changed is None])
+
+    def _get_index(self, index):
+        # Only negative indices need the length, which loads the last chunk.
+        # Indices past the end of the last chunk fail when accessing it.
+        if index < 0:
+            index += len(self)
+        if not 0 <= index // self.chunk_size < len(self.chunks):
+            raise IndexError('list index out of range')
+        return index
+
+    def _rewrite(self, start, items):
+        # Store the items in the chunks from the given chunk number onwards.
+        size = self.chunk_size
+        count = (len(items) + size - 1) // size
+        for number in xrange(count):
+            data = items[number*size:(number+1)*size]
+            if start + number < len(self.chunks):
+                chunk = self.chunks[start + number]
+                chunk.data = data
+                chunk._p_changed = True
+            else:
+                self.chunks.append(ListChunk(data))
+                self._p_changed = True
+        removed = self.chunks[start+count:]
+        if removed:
+            del self.chunks[start+count:]
+            if interfaces.IMongoDataManager.providedBy(self._p_jar):
+                self._p_jar.remove_many(
+                    [chunk for chunk in removed if chunk._p_oid is not None])
+            self._p_changed = True
+
+    def _get_tail(self, index):
+        # Return the first chunk number affected by a change at the index
+        # and all items from that chunk onwards.
+        start = index // self.chunk_size
+        return start, self[start*self.chunk_size:]
+
+    def __len__(self):
+        if not self.chunks:
+            return 0
+        return ((len(self.chunks) - 1) * self.chunk_size +
+                len(self.chunks[-1].data))
+
+    def __getitem__(self, index):
+        size = self.chunk_size
+        if isinstance(index, slice):
+            indices = xrange(*index.indices(len(self)))
+            if not indices:
+                return []
+            numbers = sorted(set([indices[0] // size, indices[-1] // size]))
+            chunks = self.chunks[numbers[0]:numbers[-1]+1]
+            self._load_chunks(chunks)
+            offset = numbers[0] * size
+            items = [item for chunk in chunks for item in chunk.data]
+            return [items[idx - offset] for idx in indices]
+        index = self._get_index(index)
+        return self.chunks[index // size].data[index % size]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            values = list(value)
+            indices = xrange(start, stop, step)
+            if step != 1 or len(values) == len(indices):
+                # The length does not change, so only the chunks holding the
+                # assigned items are written.
+                if len(values) != len(indices):
+                    raise ValueError(
+                        'attempt to assign sequence of size %i to extended '
+                        'slice of size %i' % (len(values), len(indices)))
+                self._load_chunks(
+                    [self.chunks[number] for number in
+                     sorted(set(idx // self.chunk_size for idx in indices))])
+                for idx, item in zip(indices, values):
+                    self[idx] = item
+                return
+            stop = max(start, stop)
+            first, items = self._get_tail(start)
+            offset = first * self.chunk_size
+            items[start-offset:stop-offset] = values
+            self._rewrite(first, items)
+            return
+        index = self._get_index(index)
+        chunk = self.chunks[index // self.chunk_size]
+        chunk.data[index % self.chunk_size] = value
+        chunk._p_changed = True
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            indices = xrange(*index.indices(len(self)))
+            if not indices:
+                return
+            # Rewrite the chunks from the lowest deleted index onwards.
+            low, high = sorted([indices[0], indices[-1]])
+            step = abs(index.step or 1)
+            first, items = self._get_tail(low)
+            offset = first * self.chunk_size
+            del items[low-offset:high-offset+1:step]
+            self._rewrite(first, items)
+            return
+        index = self._get_index(index)
+        start, items = self._get_tail(index)
+        del items[index - start*self.chunk_size]
+        self._rewrite(start, items)
+
+    def __iter__(self):
+        self._load_chunks(self.chunks)
+        for chunk in self.chunks:
+            for item in chunk.data:
+                yield item
+
+    def insert(self, index, value):
+        length = len(self)
+        if index < 0:
+            index = max(index + length, 0)
+        index = min(index, length)
+        start, items = self._get_tail(index)
+        items.insert(index - start*self.chunk_size, value)
+        self._rewrite(start, items)
+
+    def append(self, value):
+        if not self.chunks or len(self.chunks[-1].data) >= self.chunk_size:
+            self.chunks.append(ListChunk())
+            self._p_changed = True
+        chunk = self.chunks[-1]
+        chunk.data.append(value)
+        chunk._p_changed = True
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def pop(self, index=-1):
+        value = self[index]
+        del self[index]
+        return value
+
+    def _p_mongo_get_dependents(self):
+        # The chunks are removed along with the list.
+        return list(self.chunks)
+
+
+class ReferenceProxy(object):
+    """A stand-in for a referenced object whose class is not known yet.
+
+    Resolving the class of a reference can require a database lookup. The
+    proxy postpones the lookup until the object is really used. At that
+    point the classes of all pending proxies of the same collection are
+    resolved at once and the proxy forwards everything to the real object.
+    """
+    __slots__ = ('_p_oid', '_p_jar', '_m_object')
+
+    def __init__(self, jar, dbref):
+        object.__setattr__(self, '_p_oid', dbref)
+        object.__setattr__(self, '_p_jar', jar)
+        object.__setattr__(self, '_m_object', None)
+
+    def _m_get_object(self):
+        if self._m_object is None:
+            dbref = self._p_oid
+            reader = self._p_jar._reader
+            reader.resolve_pending(dbref.database, dbref.collection)
+            if self._m_object is None:
+                # The proxy was not pending with the current reader, for
+                # example because the data manager was reset since.
+                reader.bind_proxy(self, reader.resolve(dbref))
+        return self._m_object
+
+    @property
+    def __class__(self):
+        return self._m_get_object().__class__
+
+    def __getattr__(self, name):
+        return getattr(self._m_get_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._m_get_object(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._m_get_object(), name)
+
+    def __repr__(self):
+        return repr(self._m_get_object())
+
+    def __str__(self):
+        return str(self._m_get_object())
+
+    def __eq__(self, other):
+        return self._m_get_object() == other
+
+    def __ne__(self, other):
+        return self._m_get_object() != other
+
+    def __hash__(self):
+        return hash(self._m_get_object())
+
+    def __nonzero__(self):
+        return bool(self._m_get_object())
+
+    def __len__(self):
+        return len(self._m_get_object())
+
+    def __iter__(self):
+        return iter(self._m_get_object())
+
+    def __contains__(self, item):
+        return item in self._m_get_object()
+
+    def __getitem__(self, key):
+        return self._m_get_object()[key]
+
+    def __setitem__(self, key, value):
+        self._m_get_object()[key] = value
+
+    def __delitem__(self, key):
+        del self._m_get_object()[key]
+
+    def __call__(self, *args, **kwargs):
+        return self._m_get_object()(*args, **kwargs)
+
+
 class ObjectSerializer(object):
     zope.interface.implements(interfaces.IObjectSerializer)
 
@@ -213,6 +474,10 @@ class ObjectWriter(object):
         if type(obj) in interfaces.MONGO_NATIVE_TYPES:
             # If we have a native type, we'll just use it as the state.
             return obj
+        if type(obj) is ReferenceProxy:
+            # A reference that was never used does not need its class
+            # resolved to be stored again.
+            return obj._p_oid
         if isinstance(obj, str):
             # In Python 2, strings can be ASCII, encoded unicode or binary
             # data. Unfortunately, BSON cannot handle that. So, if we have a
@@ -300,7 +565,7 @@ class ObjectWriter(object):
         # Return the full state document
         return doc
 
-    def store(self, obj, ref_only=False, id=None):
+    def store(self, obj, ref_only=False, id=None, safe=False):
         __traceback_info__ = (obj, ref_only)
 
         db_name, coll_name = self.get_collection_name(obj)
@@ -328,7 +593,12 @@ class ObjectWriter(object):
         if obj._p_oid is None:
             if id is not None:
                 doc['_id'] = id
-            doc_id = coll.insert(doc)
+            if safe:
+                # Wait for the server to acknowledge the insert, so that
+                # errors like duplicate keys are raised.
+                doc_id = coll.insert(doc, w=1)
+            else:
+                doc_id = coll.insert(doc)
             stored = True
             obj._p_jar = self._jar
             obj._p_oid = bson.dbref.DBRef(coll_name, doc_id, db_name)
@@ -357,6 +627,38 @@ class ObjectWriter(object):
 
         return obj._p_oid
 
+    def insert_many(self, objs, ids=None):
+        # Build the documents of all objects first, so that they can be
+        # inserted with a single insert per collection.
+        if ids is None:
+            ids = [None] * len(objs)
+        entries = {}
+        for obj, id in zip(objs, ids):
+            db_name, coll_name = self.get_collection_name(obj)
+            doc = self.get_state(obj.__getstate__(), obj)
+            if getattr(obj, '_p_mongo_store_type', False):
+                doc['_py_persistent_type'] = get_dotted_name(obj.__class__)
+            if id is not None:
+                doc['_id'] = id
+            self._jar.conflict_handler.on_before_store(obj, doc)
+            entries.setdefault((db_name, coll_name), []).append((obj, doc))
+        for (db_name, coll_name), coll_entries in entries.items():
+            # Objects referenced by other objects of the list might have been
+            # stored while creating the documents already.
+            coll_entries = [(obj, doc) for obj, doc in coll_entries
+                            if obj._p_oid is None]
+            if not coll_entries:
+                continue
+            coll = self._jar.get_collection(db_name, coll_name)
+            doc_ids = coll.insert([doc for obj, doc in coll_entries])
+            for (obj, doc), doc_id in zip(coll_entries, doc_ids):
+                obj._p_jar = self._jar
+                obj._p_oid = bson.dbref.DBRef(coll_name, doc_id, db_name)
+                self._jar._object_cache[hash(obj._p_oid)] = obj
+                self._jar._latest_states[obj._p_oid] = doc
+                self._jar.conflict_handler.on_after_store(obj, doc)
+        return [obj._p_oid for obj in objs]
+
 
 class ObjectReader(object):
     zope.interface.implements(interfaces.IObjectReader)
@@ -364,6 +666,8 @@ class ObjectReader(object):
     def __init__(self, jar):
         self._jar = jar
         self._single_map_cache = {}
+        self._pending_proxies = {}
+        self._proxies = {}
         self.preferPersistent = True
 
     def simple_resolve(self, path):
@@ -485,6 +789,99 @@ class ObjectReader(object):
             OID_CLASS_LRU.put(hash(dbref), klass)
             return klass
 
+    def resolve_cached(self, dbref):
+        # Only try the lookups that do not require a database access. If none
+        # of them succeeds, ``None`` is returned.
+        klass = OID_CLASS_LRU.get(hash(dbref))
+        if klass is not None:
+            return klass
+        coll_key = (dbref.database, dbref.collection)
+        try:
+            return self._single_map_cache[coll_key]
+        except KeyError:
+            pass
+        if coll_key in COLLECTIONS_WITH_TYPE:
+            if dbref in self._jar._latest_states:
+                return self.resolve(dbref)
+            return None
+        try:
+            return self.simple_resolve(dbref.collection)
+        except ImportError:
+            return None
+
+    def resolve_many(self, dbrefs):
+        classes = {}
+        unresolved = {}
+        for dbref in dbrefs:
+            if hash(dbref) in classes:
+                continue
+            klass = self.resolve_cached(dbref)
+            if klass is None:
+                unresolved.setdefault(
+                    (dbref.database, dbref.collection), []).append(dbref)
+            else:
+                classes[hash(dbref)] = klass
+        for coll_key, coll_dbrefs in unresolved.items():
+            if coll_key not in COLLECTIONS_WITH_TYPE:
+                # Resolving the first reference primes the caches and tells
+                # us whether the documents of this collection store their
+                # type.
+                self.resolve(coll_dbrefs[0])
+            if coll_key in COLLECTIONS_WITH_TYPE:
+                self._load_types(coll_key[0], coll_key[1], coll_dbrefs)
+            for dbref in coll_dbrefs:
+                classes[hash(dbref)] = self.resolve(dbref)
+        return [classes[hash(dbref)] for dbref in dbrefs]
+
+    def resolve_pending(self, database, collection):
+        proxies = self._pending_proxies.pop((database, collection), None)
+        if not proxies:
+            return
+        classes = self.resolve_many([proxy._p_oid for proxy in proxies])
+        for proxy, klass in zip(proxies, classes):
+            self.bind_proxy(proxy, klass)
+
+    def _load_types(self, database, collection, dbrefs):
+        # Look up the types of many documents of a collection with a single
+        # query and put them into the oid-based lookup cache.
+        latest_states = self._jar._latest_states
+        missing = [dbref for dbref in dbrefs
+                   if dbref not in latest_states and
+                      OID_CLASS_LRU.get(hash(dbref)) is None]
+        if not missing:
+            return
+        coll = self._jar.get_collection(database, collection)
+        spec = {'_id': {'$in': [dbref.id for dbref in missing]}}
+        if ALWAYS_READ_FULL_DOC:
+            docs = coll.find(spec)
+        else:
+            docs = coll.find(spec, fields=('_py_persistent_type',))
+        untyped = []
+        for doc in docs:
+            dbref = bson.dbref.DBRef(collection, doc['_id'], database)
+            if ALWAYS_READ_FULL_DOC:
+                # Unghostifying the object later will not cause another
+                # database access.
+                latest_states[dbref] = doc
+            if '_py_persistent_type' in doc:
+                klass = self.simple_resolve(doc['_py_persistent_type'])
+                OID_CLASS_LRU.put(hash(dbref), klass)
+            else:
+                untyped.append(dbref)
+        if untyped:
+            # Only one class in a collection can store its documents without
+            # type, so resolving one of them is sufficient.
+            klass = self.resolve(untyped[0])
+            for dbref in untyped[1:]:
+                OID_CLASS_LRU.put(hash(dbref), klass)
+
+    def bind_proxy(self, proxy, klass):
+        obj = self._jar._object_cache.get(hash(proxy._p_oid))
+        if obj is None:
+            obj = self._create_ghost(proxy._p_oid, klass)
+        object.__setattr__(proxy, '_m_object', obj)
+        self._proxies.pop(hash(proxy._p_oid), None)
+
     def get_non_persistent_object(self, state, obj):
         if '_py_constant' in state:
             return self.simple_resolve(state.pop('_py_constant'))
@@ -525,9 +922,9 @@ class ObjectReader(object):
             # convert back to binary when serializing again.
             return str(state)
         if isinstance(state, bson.dbref.DBRef):
-            # Load a persistent object. Using the get_ghost() method, so that
-            # caching is properly applied.
-            return self.get_ghost(state)
+            # Load a persistent object. Using the get_reference() method, so
+            # that caching is properly applied.
+            return self.get_reference(state)
         if isinstance(state, dict) and state.get('_py_type') == 'type':
             # Convert a simple object reference, mostly classes.
             return self.simple_resolve(state['path'])
@@ -548,6 +945,14 @@ class ObjectReader(object):
             # All lists are converted to persistent lists, so that their state
             # changes are noticed. Also make sure that all value states are
             # converted to objects.
+            if not DEFER_CLASS_RESOLUTION:
+                # Resolve the classes of all references in the list at once,
+                # so that every reference does not cause its own lookup.
+                dbrefs = [value for value in state
+                          if isinstance(value, bson.dbref.DBRef) and
+                             hash(value) not in self._jar._object_cache]
+                if len(dbrefs) > 1:
+                    self.resolve_many(dbrefs)
             sub_obj = [self.get_object(value, obj) for value in state]
             if self.preferPersistent:
                 sub_obj = PersistentList(sub_obj)
@@ -607,8 +1012,13 @@ class ObjectReader(object):
             # before storage. Only update the latest states when the object is
             # originally loaded.
             self._jar._latest_states[obj._p_oid] = doc
+        # Volatile attributes that were set while the object was a ghost, for
+        # example its location in a container, must survive the activation.
+        volatile = [(name, value) for name, value in obj.__dict__.items()
+                    if name.startswith('_v_')]
         # Set the state.
         obj.__setstate__(state)
+        obj.__dict__.update(volatile)
 
     def get_ghost(self, dbref, klass=None):
         # If we can, we return the object from cache.
@@ -617,7 +1027,37 @@ class ObjectReader(object):
         except KeyError:
             pass
         if klass is None:
+            # Never hand out a proxy from here; resolving it binds it to the
+            # object we return, so there is only one identity per document.
+            proxy = self._proxies.get(hash(dbref))
+            if proxy is not None:
+                return proxy._m_get_object()
             klass = self.resolve(dbref)
+        return self._create_ghost(dbref, klass)
+
+    def get_reference(self, dbref):
+        if not DEFER_CLASS_RESOLUTION:
+            return self.get_ghost(dbref)
+        try:
+            return self._jar._object_cache[hash(dbref)]
+        except KeyError:
+            pass
+        if hash(dbref) in self._proxies:
+            return self._proxies[hash(dbref)]
+        klass = self.resolve_cached(dbref)
+        if klass is not None:
+            return self._create_ghost(dbref, klass)
+        # Resolving the class would be expensive, so we hand out a proxy and
+        # only resolve the class once the object is really used.
+        proxy = ReferenceProxy(self._jar, dbref)
+        self._pending_proxies.setdefault(
+            (dbref.database, dbref.collection), []).append(proxy)
+        # Proxies are kept out of the object cache, so that loading the
+        # document always yields the persistent object itself.
+        self._proxies[hash(dbref)] = proxy
+        return proxy
+
+    def _create_ghost(self, dbref, klass):
         obj = klass.__new__(klass)
         obj._p_jar = self._jar
         obj._p_oid = dbref
@@ -97,11 +97,51 @@ def doctest_Root():
       >>> root['foo'] == foo
       False
 
+    Overriding an entry updates the existing document in place:
+
+      >>> root._collection_inst.find({'name': 'foo'}).count()
+      1
+
+    The references of the names are cached, so looking up an item again does
+    not need a query:
+
+      >>> root._cache
+      {'foo': DBRef(u'mongopersist.tests.test_datamanager.Foo',
+                    ObjectId('...'), u'mongopersist_test')}
+
+    Another connection may rebind a name, so the cache only lives until the
+    data manager is reset at the end of the transaction:
+
+      >>> dm.root['stale'] = Foo('one')
+      >>> dm.root['stale'].name
+      'one'
+
+      >>> dm_B = datamanager.MongoDataManager(
+      ...     conn, default_database=DBNAME, root_database=DBNAME)
+      >>> dm_B.root['stale'] = Foo('two')
+
+      >>> dm.reset()
+      >>> dm.root._cache
+      {}
+      >>> dm.root['stale'].name
+      u'two'
+
     And of course we can delete an item:
 
       >>> del root['foo']
       >>> root.keys()
       []
+      >>> root._cache
+      {}
+
+      >>> root['foo']
+      Traceback (most recent call last):
+      ...
+      KeyError: 'foo'
+      >>> del root['foo']
+      Traceback (most recent call last):
+      ...
+      KeyError: 'foo'
     """
 
 def doctest_MongoDataManager_get_collection():
@@ -239,6 +279,181 @@ def doctest_MongoDataManager_object_dump_load_reset():
       >>> foo._p_oid = foo2._p_oid
     """
 
+def doctest_MongoDataManager_load_many():
+    r"""MongoDataManager: load_many()
+
+    Loading many objects one by one causes a query for each of them when they
+    are activated. ``load_many()`` reads all documents with a single query per
+    collection instead:
+
+      >>> foo1_ref = dm.insert(Foo('one'))
+      >>> foo2_ref = dm.insert(Foo('two'))
+      >>> super_ref = dm.insert(Super('super'))
+      >>> dm.reset()
+
+    The objects are returned in the order of the references and are already
+    activated:
+
+      >>> objs = dm.load_many([foo2_ref, super_ref, foo1_ref])
+      >>> objs
+      [<Foo two>, <Super super>, <Foo one>]
+      >>> [obj._p_changed for obj in objs]
+      [False, False, False]
+
+    The documents are also available as the latest states:
+
+      >>> sorted(ref.collection for ref in dm._latest_states)
+      ['Super', 'mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo']
+
+    Objects that are already loaded, are simply returned:
+
+      >>> dm.load_many([foo1_ref])[0] is objs[2]
+      True
+
+    Optionally, the objects are only returned as ghosts:
+
+      >>> dm.reset()
+      >>> objs = dm.load_many([foo1_ref, foo2_ref], activate=False)
+      >>> [obj._p_changed for obj in objs]
+      [None, None]
+      >>> dm._latest_states
+      {}
+    """
+
+def doctest_MongoDataManager_query():
+    r"""MongoDataManager: query(klass, spec)
+
+    When several classes share a collection, the objects of a class and its
+    subclasses can be queried:
+
+      >>> dm.insert(Super('one'))
+      DBRef('Super', ObjectId('4f5c114f37a08e2cac000000'), 'mongopersist_test')
+      >>> dm.insert(Sub('two'))
+      DBRef('Super', ObjectId('4f5c114f37a08e2cac000000'), 'mongopersist_test')
+      >>> dm.insert(Sub('three'))
+      DBRef('Super', ObjectId('4f5c114f37a08e2cac000000'), 'mongopersist_test')
+      >>> dm.reset()
+
+    The query is restricted by the stored types:
+
+      >>> dm.get_query_types(Sub)
+      ('mongopersist_test', 'Super',
+       [u'mongopersist.tests.test_datamanager.Sub'], None)
+      >>> sorted(obj.name for obj in dm.query(Sub))
+      [u'three', u'two']
+      >>> sorted(obj.name for obj in dm.query(Sub, {'name': 'two'}))
+      [u'two']
+
+    All documents are instances of the super class, so its query is not
+    restricted. Documents without a stored type are known to be of the class
+    that does not store its type:
+
+      >>> dm.get_query_types(Super)
+      ('mongopersist_test', 'Super', None,
+       <class 'mongopersist.tests.test_datamanager.Super'>)
+      >>> sorted(dm.query(Super), key=lambda obj: obj.name)
+      [<Super one>, <Sub three>, <Sub two>]
+    """
+
+
+def doctest_MongoDataManager_prefetch():
+    r"""MongoDataManager: prefetch()
+
+    When many objects are loaded, the objects they reference are loaded with
+    a query each once they are used. The data manager can prefetch the
+    documents referenced along attribute paths instead:
+
+      >>> boss = Super('boss')
+      >>> foo1 = Foo('one')
+      >>> foo1.friend = Super('super one')
+      >>> foo1.friend.boss = boss
+      >>> foo2 = Foo('two')
+      >>> foo2.friend = Super('super two')
+      >>> foo2.friend.boss = boss
+      >>> foo1_ref = dm.insert(foo1)
+      >>> foo2_ref = dm.insert(foo2)
+      >>> dm.flush()
+      >>> dm.reset()
+
+    Every level of the path is read with one query per collection:
+
+      >>> coll = dm.get_collection_from_object(foo1)
+      >>> foos = list(coll.find_objects(prefetch=['friend.boss']))
+      >>> sorted(ref.collection for ref in dm._latest_states)
+      ['Super', 'Super', 'Super',
+       'mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo']
+
+      >>> [foo.friend.boss for foo in foos]
+      [<Super boss>, <Super boss>]
+
+    Prefetching can also be applied to documents directly:
+
+      >>> dm.reset()
+      >>> docs = list(coll.find())
+      >>> dm.prefetch(docs, ['friend'])
+      >>> sorted(ref.collection for ref in dm._latest_states)
+      ['Super', 'Super']
+    """
+
+def doctest_MongoDataManager_prefetch_learned():
+    r"""MongoDataManager: learned prefetching
+
+    The data manager can also learn which references are used after objects
+    are loaded in bulk and prefetch them in future bulk loads:
+
+      >>> from mongopersist import prefetch
+      >>> prefetch.LEARN_REFERENCES = True
+      >>> orig_min_samples = prefetch.MIN_SAMPLES
+      >>> prefetch.MIN_SAMPLES = 3
+
+      >>> for name in ('one', 'two', 'three'):
+      ...     foo = Foo(name)
+      ...     foo.friend = Super('super ' + name)
+      ...     foo.other = Super('other ' + name)
+      ...     ref = dm.insert(foo)
+      >>> dm.flush()
+      >>> dm.reset()
+
+    Initially nothing is known, so only the loaded objects are read:
+
+      >>> coll = dm.get_collection_from_object(foo)
+      >>> foos = list(coll.find_objects())
+      >>> sorted(ref.collection for ref in dm._latest_states)
+      ['mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo']
+
+    But the use of the references is recorded:
+
+      >>> sorted(foo.friend.name for foo in foos)
+      [u'super one', u'super three', u'super two']
+
+      >>> pprint(prefetch.STATISTICS.report())
+      [('mongopersist.tests.test_datamanager.Foo', 'friend', 3, 3, True),
+       ('mongopersist.tests.test_datamanager.Foo', 'other', 3, 0, False)]
+
+    The next bulk load of foos prefetches their friends:
+
+      >>> dm.reset()
+      >>> foos = list(coll.find_objects())
+      >>> sorted(ref.collection for ref in dm._latest_states)
+      ['Super', 'Super', 'Super',
+       'mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo']
+
+      >>> prefetch.STATISTICS.get_paths(Foo)
+      ('friend',)
+
+    Cleanup:
+
+      >>> prefetch.STATISTICS.clear()
+      >>> prefetch.MIN_SAMPLES = orig_min_samples
+      >>> prefetch.LEARN_REFERENCES = False
+    """
+
 def doctest_MongoDataManager_dump_only_on_real_change():
     r"""MongoDataManager: dump(): dump on real change only.
 
@@ -557,6 +772,39 @@ def doctest_MongoDataManager_remove():
     """
 
 
+def doctest_MongoDataManager_insert_many_remove_many():
+    r"""MongoDataManager: insert_many(objs), remove_many(objs)
+
+    Many objects can be inserted with a single insert per collection:
+
+      >>> foos = [Foo('one'), Foo('two'), Super('three')]
+      >>> refs = dm.insert_many(foos)
+      >>> [ref.collection for ref in refs]
+      ['mongopersist.tests.test_datamanager.Foo',
+       'mongopersist.tests.test_datamanager.Foo',
+       'Super']
+      >>> len(dm._inserted_objects)
+      3
+
+      >>> sorted(doc['name']
+      ...        for doc in dm._get_collection_from_object(foos[0]).find())
+      [u'one', u'two']
+
+    They can also be removed with a single query per collection. Ghosts are
+    loaded first, so that their states are known when aborting:
+
+      >>> dm.reset()
+      >>> foos = [dm.load(ref) for ref in refs]
+      >>> dm.remove_many(foos)
+      >>> tuple(dm._get_collection_from_object(foos[0]).find())
+      ()
+      >>> len(dm._removed_objects)
+      3
+      >>> len(dm._original_states)
+      3
+    """
+
+
 def doctest_MongoDataManager_insert_remove():
     r"""MongoDataManager: insert and remove in the same transaction
 
@@ -0,0 +1,117 @@
+##############################################################################
+#
+# Copyright (c) 2013 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Mongo Index Management Tests"""
+import doctest
+import persistent
+from pprint import pprint
+
+from mongopersist import indexes, testing
+
+class Person(persistent.Persistent):
+    _p_mongo_collection = 'person'
+    _p_mongo_indexes = ['name', ('email', {'unique': True})]
+
+def doctest_normalize_index():
+    r"""normalize_index(): index declarations
+
+    An index can be declared by a field name, a list of keys or a tuple of
+    the keys and the index options:
+
+      >>> indexes.normalize_index('name')
+      ([('name', 1)], {})
+      >>> indexes.normalize_index([('parent', 1), ('key', -1)])
+      ([('parent', 1), ('key', -1)], {})
+      >>> indexes.normalize_index(('email', {'unique': True}))
+      ([('email', 1)], {'unique': True})
+    """
+
+def doctest_ensure_indexes():
+    r"""ensure_indexes(): create missing indexes
+
+    Besides the indexes declared by the given classes, the root and name map
+    collections are indexed as well:
+
+      >>> created, redundant = indexes.ensure_indexes(dm, [Person])
+      >>> pprint(created)
+      [('mongopersist_test', 'persistence_name_map', 'collection_1_database_1'),
+       ('mongopersist_test', 'persistence_root', 'name_1'),
+       ('mongopersist_test', 'person', 'name_1'),
+       ('mongopersist_test', 'person', 'email_1')]
+      >>> redundant
+      []
+
+    Existing indexes are not created again:
+
+      >>> indexes.ensure_indexes(dm, [Person])
+      ([], [])
+
+    Indexes that are a prefix of another index are reported as redundant:
+
+      >>> coll = dm._conn[DBNAME]['person']
+      >>> coll.create_index([('name', 1), ('age', 1)])
+      'name_1_age_1'
+      >>> indexes.ensure_indexes(dm, [Person])
+      ([], [('mongopersist_test', 'person', 'name_1', 'name_1_age_1')])
+
+    Collections storing multiple types get an index on the type:
+
+      >>> class Student(Person):
+      ...     pass
+      >>> dm._writer.get_collection_name(Person())
+      ('mongopersist_test', 'person')
+      >>> dm._writer.get_collection_name(Student())
+      ('mongopersist_test', 'person')
+      >>> created, redundant = indexes.ensure_indexes(dm)
+      >>> created
+      [('mongopersist_test', 'person', '_py_persistent_type_1')]
+    """
+
+def doctest_ensure_indexes_mismatch():
+    r"""ensure_indexes(): existing indexes with other options
+
+    An existing index with the declared keys, but different options, is not
+    silently accepted, since the guarantees of the declaration would not
+    hold. For example, the root and email indexes must be unique:
+
+      >>> dm._conn[DBNAME]['persistence_root'].create_index([('name', 1)])
+      'name_1'
+      >>> dm._conn[DBNAME]['person'].create_index([('email', 1)])
+      'email_1'
+
+      >>> indexes.ensure_indexes(dm, [Person])
+      Traceback (most recent call last):
+      ...
+      IndexMismatchError:
+          [('mongopersist_test', 'persistence_root', 'name_1',
+            'unique', True, None),
+           ('mongopersist_test', 'person', 'email_1', 'unique', True, None)]
+
+    No index was created, since the mismatched indexes have to be migrated
+    first:
+
+      >>> sorted(dm._conn[DBNAME]['person'].index_information())
+      [u'_id_', u'email_1']
+
+      >>> dm._conn[DBNAME]['persistence_root'].drop_index('name_1')
+      >>> dm._conn[DBNAME]['person'].drop_index('email_1')
+      >>> created, redundant = indexes.ensure_indexes(dm, [Person])
+      >>> pprint(dm._conn[DBNAME]['person'].index_information()['email_1'])
+      {...u'key': [(u'email', 1)]...u'unique': True...}
+    """
+
+def test_suite():
+    return doctest.DocTestSuite(
+        setUp=testing.setUp, tearDown=testing.tearDown,
+        checker=testing.checker,
+        optionflags=testing.OPTIONFLAGS)
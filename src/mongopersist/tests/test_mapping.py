@@ -124,6 +124,69 @@ def doctest_MongoCollectionMapping_filter():
     properly setup and tear down the filter criteria.
     """
 
+def doctest_MongoCollectionMapping_bulk():
+    r"""MongoCollectionMapping: bulk access
+
+      >>> class SimpleContainer(mapping.MongoCollectionMapping):
+      ...     __mongo_collection__ = 'mongopersist.tests.test_mapping.Item'
+      ...     __mongo_mapping_key__ = 'name'
+
+      >>> container = SimpleContainer(dm)
+      >>> container['one'] = Item()
+      >>> container['two'] = Item()
+      >>> container['three'] = Item()
+      >>> transaction.commit()
+
+    The length of the mapping is counted by the server:
+
+      >>> len(container)
+      3
+
+    Multiple items can be looked up using a single query. Missing keys are
+    not part of the result:
+
+      >>> items = container.get_many(['one', 'three', 'four'])
+      >>> sorted(items)
+      [u'one', u'three']
+      >>> items['one'].name
+      u'one'
+
+    The found documents are kept, so that the items can be activated without
+    loading them again:
+
+      >>> items['three']._p_oid in dm._latest_states
+      True
+
+    The references of all looked up keys are cached for the transaction, so
+    that accessing the items again does not need a query:
+
+      >>> sorted(container._get_cache())
+      [u'one', u'three']
+      >>> container['one'] is items['one']
+      True
+
+    The cache is updated when items are removed:
+
+      >>> del container['one']
+      >>> sorted(container._get_cache())
+      [u'three']
+
+    When the transaction ends, the cache is emptied:
+
+      >>> transaction.commit()
+      >>> container._get_cache()
+      {}
+
+    ``values()`` and ``items()`` load all objects with a single query:
+
+      >>> sorted(container)
+      [u'three', u'two']
+      >>> sorted(item.name for item in container.values())
+      [u'three', u'two']
+      >>> sorted((key, item.name) for key, item in container.items())
+      [(u'three', u'three'), (u'two', u'two')]
+    """
+
 def test_suite():
     return doctest.DocTestSuite(
         setUp=testing.setUp, tearDown=testing.tearDown,
@@ -753,6 +753,49 @@ def doctest_ObjectReader_resolve_lookup_with_multiple_maps_dont_read_full():
 
     """
 
+def doctest_ObjectReader_resolve_many():
+    """ObjectReader: resolve_many()
+
+    Many references can be resolved at once. The documents that are needed to
+    determine the classes are read with a single query per collection:
+
+      >>> writer = serialize.ObjectWriter(dm)
+      >>> top = Top()
+      >>> top_ref = writer.store(top)
+      >>> top2 = Top2()
+      >>> top2_ref = writer.store(top2)
+      >>> top3 = Top2()
+      >>> top3_ref = writer.store(top3)
+      >>> dm.reset()
+
+      >>> reader = serialize.ObjectReader(dm)
+      >>> pprint.pprint(reader.resolve_many([top_ref, top2_ref, top3_ref]))
+      [<class 'mongopersist.tests.test_serialize.Top'>,
+       <class 'mongopersist.tests.test_serialize.Top2'>,
+       <class 'mongopersist.tests.test_serialize.Top2'>]
+
+    The documents were put into the latest states, so that loading the
+    objects does not cause another query, and the classes were cached:
+
+      >>> top3_ref in dm._latest_states
+      True
+      >>> serialize.OID_CLASS_LRU.get(hash(top3_ref))
+      <class 'mongopersist.tests.test_serialize.Top2'>
+
+    Lists of references are resolved this way automatically:
+
+      >>> dm.reset()
+      >>> serialize.OID_CLASS_LRU.__init__(20000)
+      >>> serialize.COLLECTIONS_WITH_TYPE.__init__()
+
+      >>> reader = serialize.ObjectReader(dm)
+      >>> objs = reader.get_object([top_ref, top2_ref, top3_ref], None)
+      >>> [obj.__class__.__name__ for obj in objs]
+      ['Top', 'Top2', 'Top2']
+      >>> top3_ref in dm._latest_states
+      True
+    """
+
 def doctest_ObjectReader_get_non_persistent_object_py_type():
     """ObjectReader: get_non_persistent_object(): _py_type
 
@@ -944,6 +987,77 @@ def doctest_ObjectReader_get_ghost():
       0
     """
 
+def doctest_ObjectReader_get_reference_deferred():
+    """ObjectReader: get_reference(): deferred class resolution
+
+    Resolving the class of a reference can require a database lookup. When
+    ``DEFER_CLASS_RESOLUTION`` is set, the reader hands out proxies for those
+    references instead:
+
+      >>> serialize.DEFER_CLASS_RESOLUTION = True
+
+      >>> st_ref = dm.insert(StoreType())
+      >>> st2_ref = dm.insert(StoreType2())
+      >>> st3_ref = dm.insert(StoreType2())
+      >>> dm.reset()
+      >>> serialize.OID_CLASS_LRU.__init__(20000)
+
+      >>> refs = dm._reader.get_object([st_ref, st2_ref, st3_ref], None)
+      >>> [type(ref).__name__ for ref in refs]
+      ['ReferenceProxy', 'ReferenceProxy', 'ReferenceProxy']
+
+    Storing a proxy again does not require its class:
+
+      >>> dm._writer.get_state(refs[0])
+      DBRef('storetype', ObjectId('4eb1e0f237a08e38dd000002'),
+            'mongopersist_test')
+      >>> refs[0]._m_object is None
+      True
+
+    As soon as one proxy is used, the classes of all pending proxies of the
+    same collection are resolved at once:
+
+      >>> refs[1].__class__
+      <class 'mongopersist.tests.test_serialize.StoreType2'>
+      >>> [ref._m_object.__class__.__name__ for ref in refs]
+      ['StoreType', 'StoreType2', 'StoreType2']
+      >>> isinstance(refs[0], StoreType)
+      True
+
+    The documents were read with a single query and are available for
+    activating the objects:
+
+      >>> st3_ref in dm._latest_states
+      True
+
+    The proxies never enter the object cache, so loading a document yields
+    the object the proxy forwards to:
+
+      >>> dm.load(st3_ref) is refs[2]._m_object
+      True
+
+    This also holds when the document is loaded before its proxy is used:
+
+      >>> dm.reset()
+      >>> serialize.OID_CLASS_LRU.__init__(20000)
+      >>> proxy = dm._reader.get_object(st_ref, None)
+      >>> type(proxy).__name__
+      'ReferenceProxy'
+      >>> hash(st_ref) in dm._object_cache
+      False
+      >>> obj = dm.load(st_ref)
+      >>> type(obj).__name__
+      'StoreType'
+      >>> proxy._m_get_object() is obj
+      True
+      >>> dm._reader.get_object(st_ref, None) is obj
+      True
+
+    Cleanup:
+
+      >>> serialize.DEFER_CLASS_RESOLUTION = False
+    """
+
 def doctest_ObjectReader_set_ghost_state():
     r"""ObjectReader: set_ghost_state()
 
@@ -1065,6 +1179,111 @@ def doctest_PersistentDict_equality():
     """
 
 
+def doctest_ChunkedPersistentList():
+    """ChunkedPersistentList: items stored in chunk documents
+
+    A chunked list stores its items in chunks of a fixed size:
+
+      >>> log = serialize.ChunkedPersistentList(range(5), chunk_size=2)
+      >>> dm.root['log'] = log
+      >>> commit()
+
+      >>> cn = 'mongopersist.serialize.ListChunk'
+      >>> sorted(doc['data'] for doc in conn[DBNAME][cn].find())
+      [[0, 1], [2, 3], [4]]
+
+    Indexing, slicing and the length only load the chunks involved:
+
+      >>> log = dm.root['log']
+      >>> len(log)
+      5
+      >>> log[-2], log[1:4]
+      (3, [1, 2, 3])
+      >>> [chunk._p_changed for chunk in log.chunks]
+      [False, False, False]
+
+      >>> commit()
+      >>> log = dm.root['log']
+      >>> log[3]
+      3
+      >>> [chunk._p_changed for chunk in log.chunks]
+      [None, False, None]
+
+    Appending only writes the last chunk, unless a new one is needed:
+
+      >>> log.append(5)
+      >>> log._p_changed, [chunk._p_changed for chunk in log.chunks]
+      (False, [None, False, True])
+      >>> log.append(6)
+      >>> log._p_changed
+      True
+      >>> commit()
+      >>> list(dm.root['log'])
+      [0, 1, 2, 3, 4, 5, 6]
+
+    Inserting and deleting items rewrites the following chunks, and chunks
+    that are not needed anymore are removed:
+
+      >>> log = dm.root['log']
+      >>> log.insert(0, -1)
+      >>> del log[1:3]
+      >>> log.pop()
+      6
+      >>> commit()
+      >>> list(dm.root['log'])
+      [-1, 2, 3, 4, 5]
+      >>> conn[DBNAME][cn].count()
+      3
+
+    Slices are handled the same way. Assigning as many items as the slice
+    holds only writes the chunks of those items, otherwise the chunks from the
+    first one involved are rewritten:
+
+      >>> commit()
+      >>> log = dm.root['log']
+      >>> log[2:4] = ['three', 'four']
+      >>> [chunk._p_changed for chunk in log.chunks]
+      [None, True, False]
+      >>> commit()
+
+      >>> log = dm.root['log']
+      >>> log[3:] = [5]
+      >>> [chunk._p_changed for chunk in log.chunks]
+      [None, True]
+      >>> commit()
+
+      >>> log = dm.root['log']
+      >>> del log[2::2]
+      >>> [chunk._p_changed for chunk in log.chunks]
+      [None, True]
+      >>> commit()
+      >>> list(dm.root['log'])
+      [-1, 2, 5]
+
+    Extended slices behave like those of lists:
+
+      >>> log = dm.root['log']
+      >>> log[::2] = ['a', 'b']
+      >>> log[:]
+      ['a', 2, 'b']
+      >>> log[::2] = ['a']
+      Traceback (most recent call last):
+      ...
+      ValueError: attempt to assign sequence of size 1 to extended slice of size 2
+      >>> del log[::-2]
+      >>> log[:]
+      [2]
+      >>> commit()
+
+    The chunks are removed along with the list:
+
+      >>> dm.remove(dm.root['log'])
+      >>> commit()
+      >>> conn[DBNAME][cn].count()
+      0
+    """
+
+
 def test_suite():
     return doctest.DocTestSuite(
         setUp=testing.setUp, tearDown=testing.tearDown,
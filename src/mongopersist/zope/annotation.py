@@ -12,6 +12,8 @@
 #
 ##############################################################################
 """Mongo Annotations Implementation."""
+import bson.dbref
+import persistent
 from persistent.dict import PersistentDict
 from zope import component, interface
 from zope.annotation import interfaces
@@ -29,6 +31,14 @@ class IMongoAttributeAnnotatable(interfaces.IAnnotatable):
 
     """
 
+class IMongoDocumentAnnotatable(interfaces.IAnnotatable):
+    """Marker indicating that annotations are stored in a separate document.
+
+    This is a marker interface giving permission for an `IAnnotations`
+    adapter to store data in a document of the annotations collection, which
+    references the annotated object.
+    """
+
 def normalize_key(key):
     return key.replace('.', '_')
 
@@ -90,3 +100,125 @@ class AttributeAnnotations(DictMixin):
             delattr(self.obj, key)
         except AttributeError:
             raise KeyError(key)
+
+
+class AnnotationsData(persistent.Persistent):
+    """The annotations of one object, stored in their own document.
+
+    The documents are looked up by their owner, so the unique ``owner`` index
+    must be created by passing this class to
+    ``mongopersist.indexes.ensure_indexes()``, for example with ``python -m
+    mongopersist.indexes mongopersist.zope.annotation.AnnotationsData``.
+    """
+    _p_mongo_collection = 'persistence_annotations'
+    _p_mongo_indexes = (('owner', {'unique': True}),)
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.data = {}
+
+
+def get_stored_annotations(obj):
+    """Return the stored annotations data of the object as a list.
+
+    Annotated classes return it from ``_p_mongo_get_dependents()``, so that
+    the data manager removes the annotations along with the object.
+    """
+    data = DocumentAnnotations(obj)._get_data()
+    if data is None or data._p_oid is None:
+        return []
+    return [data]
+
+
+@interface.implementer(interfaces.IAnnotations)
+@component.adapter(IMongoDocumentAnnotatable)
+class DocumentAnnotations(DictMixin):
+    """Store annotations in a separate document
+
+    The annotations are loaded on first access and cached in the data
+    manager, so that the annotated object's document neither contains nor
+    writes them. Only the annotated objects that are already stored can be
+    annotated. The annotations are not removed with their object, unless the
+    object's class returns ``get_stored_annotations(self)`` from
+    ``_p_mongo_get_dependents()``.
+    """
+
+    def __init__(self, obj, context=None):
+        self.obj = obj
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+    def _get_data(self, create=False):
+        jar = self.obj._p_jar
+        if jar is None:
+            if create:
+                raise ValueError(
+                    'The annotated object must be stored first.', self.obj)
+            return None
+        oid = self.obj._p_oid
+        if oid not in jar.annotations:
+            db_name = getattr(
+                AnnotationsData, '_p_mongo_database', jar.default_database)
+            coll_name = AnnotationsData._p_mongo_collection
+            doc = jar.get_collection(db_name, coll_name).find_one(
+                {'owner': oid})
+            data = None
+            if doc is not None:
+                dbref = bson.dbref.DBRef(coll_name, doc['_id'], db_name)
+                jar._latest_states[dbref] = doc
+                data = jar.load(dbref)
+            jar.annotations[oid] = data
+        data = jar.annotations[oid]
+        if data is None and create:
+            data = jar.annotations[oid] = AnnotationsData(self.obj)
+            jar.register(data)
+        return data
+
+    def get(self, key, default=None):
+        """See zope.annotation.interfaces.IAnnotations"""
+        data = self._get_data()
+        if data is None:
+            return default
+        return data.data.get(key, default)
+
+    def __getitem__(self, key):
+        data = self._get_data()
+        if data is None:
+            raise KeyError(key)
+        return data.data[key]
+
+    def keys(self):
+        data = self._get_data()
+        if data is None:
+            return []
+        return data.data.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        data = self._get_data()
+        return data is not None and key in data.data
+
+    def __len__(self):
+        data = self._get_data()
+        if data is None:
+            return 0
+        return len(data.data)
+
+    def __setitem__(self, key, value):
+        """See zope.annotation.interfaces.IAnnotations"""
+        data = self._get_data(create=True)
+        data.data[key] = value
+        data._p_changed = True
+
+    def __delitem__(self, key):
+        """See zope.app.interfaces.annotation.IAnnotations"""
+        data = self._get_data()
+        if data is None:
+            raise KeyError(key)
+        del data.data[key]
+        data._p_changed = True
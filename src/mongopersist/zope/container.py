@@ -13,20 +13,110 @@
 ##############################################################################
 """Mongo Persistence Zope Containers"""
 import UserDict
+import binascii
+import bisect
+import collections
 import persistent
-import transaction
+import re
 import bson.dbref
 import bson.objectid
+import bson.son
+import pymongo
+import pymongo.errors
+import repoze.lru
 import zope.component
+import zope.event
+import zope.lifecycleevent
 from bson.errors import InvalidId
 from rwproperty import getproperty, setproperty
 from zope.container import contained, sample
 from zope.container.interfaces import IContainer
 
-from mongopersist import interfaces
+from mongopersist import datamanager, interfaces, serialize
 from mongopersist.zope import interfaces as zinterfaces
 
 USE_CONTAINER_CACHE = True
+# The maximum amount of items each container keeps in its cache for a
+# transaction. ``None`` means that the cache is not bounded.
+CONTAINER_CACHE_SIZE = 10000
+# When set, unmodified items evicted from a container cache are also released
+# from the data manager, so that their memory can be freed. Touching a
+# released object reads its document again and loading its key again creates
+# a new object, so this only pays off for traversals of huge containers.
+RELEASE_EVICTED_ITEMS = False
+
+# A process wide cache of the item references by container and key, which
+# survives transactions, so that key lookups do not need to query the
+# container's items. Items added or renamed by other processes are only
+# noticed once the entry expires or ``invalidate_key_cache()`` is called, so
+# the cache must be enabled explicitly. The document of a cached reference
+# is read by its id right away, unless its state is known already, so that
+# an item removed by another process still raises a ``KeyError``.
+USE_KEY_CACHE = False
+KEY_CACHE_SIZE = 10000
+KEY_CACHE_TIMEOUT = 60
+KEY_CACHE = repoze.lru.ExpiringLRUCache(KEY_CACHE_SIZE, KEY_CACHE_TIMEOUT)
+
+
+def invalidate_key_cache(oid=None, key=None):
+    """Invalidate the cached reference of a key in the container with the oid.
+
+    Without a key the entire cache is cleared. This is the hook for signals
+    about changes made by other processes.
+    """
+    if key is None:
+        KEY_CACHE.clear()
+    else:
+        KEY_CACHE.invalidate((oid, key))
+
+
+# Event dispatching modes of the bulk operations.
+EVENTS_EACH = 'each'
+EVENTS_BATCH = 'batch'
+EVENTS_NONE = 'none'
+
+class ContainerCache(collections.OrderedDict):
+    """The items of a container that were loaded in a transaction.
+
+    Beyond its size the least recently used items are evicted, after which
+    the cache cannot be complete anymore. If a data manager is given, evicted
+    items are released from it, unless they were modified. The cache also
+    remembers the length of the container.
+    """
+
+    def __init__(self, size=None, jar=None):
+        self.size = size
+        self.jar = jar
+        self.complete = False
+        self.length = None
+        super(ContainerCache, self).__init__()
+
+    __repr__ = dict.__repr__
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        value = dict.__getitem__(self, key)
+        if self.size is not None:
+            # Mark the item as recently used.
+            collections.OrderedDict.__delitem__(self, key)
+            collections.OrderedDict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            collections.OrderedDict.__delitem__(self, key)
+        collections.OrderedDict.__setitem__(self, key, value)
+        if self.size is not None and len(self) > self.size:
+            key, evicted = self.popitem(last=False)
+            self.complete = False
+            if self.jar is not None:
+                self.jar.release(evicted)
+
+    def mark_complete(self, count):
+        # Only if none of the counted items was evicted, all items are known.
+        self.complete = len(self) >= count
+
 
 class MongoContained(contained.Contained):
 
@@ -122,6 +212,187 @@ class SimpleMongoContainer(sample.SampleContainer, persistent.Persistent):
         self._p_changed = True
 
 
+class ContainerBucket(persistent.Persistent):
+    """A document holding a range of the items of a bucketed container."""
+
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+
+    def __setstate__(self, state):
+        # Work with a plain dictionary, the bucket is marked as changed
+        # explicitly.
+        state = dict(state)
+        state['data'] = dict(state.get('data', {}))
+        super(ContainerBucket, self).__setstate__(state)
+
+
+class BucketedData(UserDict.DictMixin):
+    """The item mapping of a bucketed container.
+
+    The items are spread over buckets ordered by key. ``bucket_keys`` holds
+    the smallest key of every bucket but the first and ``length`` the number
+    of items, so that no bucket is loaded to compute it. Items stored in the
+    ``data`` dictionary of a ``SimpleMongoContainer`` document are only moved
+    into buckets on the first change.
+    """
+
+    def __init__(self, container, buckets=None, bucket_keys=None,
+                 legacy=None, length=0):
+        self.container = container
+        self.buckets = list(buckets or [ContainerBucket()])
+        self.bucket_keys = list(bucket_keys or [])
+        self.legacy = legacy
+        self.length = length
+
+    def _get_bucket_index(self, key):
+        return bisect.bisect_right(self.bucket_keys, key)
+
+    def _load_buckets(self):
+        # Load all bucket ghosts with a single query.
+        jar = self.container._p_jar
+        if interfaces.IMongoDataManager.providedBy(jar):
+            jar.load_states([bucket._p_oid for bucket in self.buckets
+                             if bucket._p_changed is None])
+
+    def _migrate(self):
+        items = sorted(self.legacy.items())
+        size = max(self.container._m_bucket_size // 2, 1)
+        self.buckets = [ContainerBucket(items[idx:idx+size])
+                        for idx in xrange(0, len(items), size)]
+        self.buckets = self.buckets or [ContainerBucket()]
+        self.bucket_keys = [min(bucket.data) for bucket in self.buckets[1:]]
+        self.length = len(items)
+        self.legacy = None
+        self.container._p_changed = True
+
+    def _split(self, index):
+        bucket = self.buckets[index]
+        keys = sorted(bucket.data)
+        new = ContainerBucket(
+            (key, bucket.data.pop(key)) for key in keys[len(keys)//2:])
+        self.buckets.insert(index+1, new)
+        self.bucket_keys.insert(index, min(new.data))
+        self.container._p_changed = True
+
+    def _remove_bucket(self, index):
+        bucket = self.buckets.pop(index)
+        del self.bucket_keys[max(index-1, 0)]
+        if interfaces.IMongoDataManager.providedBy(bucket._p_jar):
+            bucket._p_jar.remove(bucket)
+        self.container._p_changed = True
+
+    def _change_length(self, delta):
+        # Documents written before the length was stored count their items
+        # on the first call of ``len()``.
+        if self.length is not None:
+            self.length += delta
+            self.container._p_changed = True
+
+    def __getitem__(self, key):
+        if self.legacy is not None:
+            return self.legacy[key]
+        return self.buckets[self._get_bucket_index(key)].data[key]
+
+    def __setitem__(self, key, value):
+        if self.legacy is not None:
+            self._migrate()
+        index = self._get_bucket_index(key)
+        bucket = self.buckets[index]
+        if key not in bucket.data:
+            self._change_length(1)
+        bucket.data[key] = value
+        bucket._p_changed = True
+        if len(bucket.data) > self.container._m_bucket_size:
+            self._split(index)
+
+    def __delitem__(self, key):
+        if self.legacy is not None:
+            self._migrate()
+        index = self._get_bucket_index(key)
+        bucket = self.buckets[index]
+        del bucket.data[key]
+        bucket._p_changed = True
+        self._change_length(-1)
+        if not bucket.data and len(self.buckets) > 1:
+            self._remove_bucket(index)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def iteritems(self):
+        if self.legacy is not None:
+            return iter(sorted(self.legacy.items()))
+        self._load_buckets()
+        return (item for bucket in self.buckets
+                for item in sorted(bucket.data.items()))
+
+    def __iter__(self):
+        return (key for key, value in self.iteritems())
+
+    def keys(self):
+        return list(self)
+
+    def __len__(self):
+        if self.legacy is not None:
+            return len(self.legacy)
+        if self.length is None:
+            self._load_buckets()
+            self.length = sum(len(bucket.data) for bucket in self.buckets)
+        return self.length
+
+
+class BucketedMongoContainer(SimpleMongoContainer):
+    """A simple container storing its items in bucket documents.
+
+    Only the buckets holding the changed keys are written. The container
+    document holds the bucket references and the number of items, so it
+    changes when items are added or removed, but never grows with them.
+    """
+    _m_bucket_size = 500
+
+    def _newContainerData(self):
+        return BucketedData(self)
+
+    def __getstate__(self):
+        state = persistent.Persistent.__getstate__(self)
+        data = state.pop('_SampleContainer__data')
+        if data.legacy is not None:
+            state['data'] = data.legacy
+        else:
+            state['buckets'] = data.buckets
+            state['bucket_keys'] = data.bucket_keys
+            if data.length is not None:
+                state['length'] = data.length
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        legacy = state.pop('data', None)
+        if legacy is not None:
+            legacy = dict(legacy)
+        state['_SampleContainer__data'] = BucketedData(
+            self, state.pop('buckets', None), state.pop('bucket_keys', None),
+            legacy, state.pop('length', None))
+        persistent.Persistent.__setstate__(self, state)
+
+    def _p_mongo_get_dependents(self):
+        # The buckets are removed along with the container.
+        return list(self._SampleContainer__data.buckets)
+
+    def __setitem__(self, key, obj):
+        sample.SampleContainer.__setitem__(self, key, obj)
+
+    def __delitem__(self, key):
+        obj = self[key]
+        sample.SampleContainer.__delitem__(self, key)
+        if self._m_remove_documents:
+            self._p_jar.remove(obj)
+
+
 class MongoContainer(contained.Contained,
                      persistent.Persistent,
                      UserDict.DictMixin):
@@ -131,6 +402,8 @@ class MongoContainer(contained.Contained,
     _m_mapping_key = 'key'
     _m_parent_key = 'parent'
     _m_remove_documents = True
+    _m_indexes = ()
+    _m_unique_keys = False
 
     def __init__(self, collection=None, database=None,
                  mapping_key=None, parent_key=None):
@@ -167,7 +440,30 @@ class MongoContainer(contained.Contained,
         if interfaces.IMongoDataManager.providedBy(self._p_jar):
             return self
         else:
-            return 'zodb-'+''.join("%02x" % ord(x) for x in self._p_oid).strip()
+            return 'zodb-' + binascii.hexlify(self._p_oid)
+
+    def _m_get_parent_key_state(self):
+        # Serializing the parent is not cheap, so the state is remembered
+        # for the oid it was computed for.
+        cached = getattr(self, '_v_m_parent_key_state', None)
+        if cached is not None and cached[0] == self._p_oid:
+            return cached[1]
+        state = self._m_jar._writer.get_state(self._m_get_parent_key_value())
+        self._v_m_parent_key_state = (self._p_oid, state)
+        return state
+
+    def _m_get_indexes(self):
+        # By default the lookups by parent and key are indexed. This also
+        # covers the queries for the keys.
+        keys = [(name, 1) for name in (self._m_parent_key, self._m_key_field)
+                if name is not None]
+        indexes = list(self._m_indexes)
+        if keys and self._m_unique_keys:
+            # Documents that are not in any container have neither key.
+            indexes.insert(0, (keys, {'unique': True, 'sparse': True}))
+        elif keys:
+            indexes.insert(0, keys)
+        return indexes
 
     def _m_get_items_filter(self):
         filter = {}
@@ -177,8 +473,7 @@ class MongoContainer(contained.Contained,
         if self._m_mapping_key is not None:
             filter[self._m_mapping_key] = {'$exists': True}
         if self._m_parent_key is not None:
-            gs = self._m_jar._writer.get_state
-            filter[self._m_parent_key] = gs(self._m_get_parent_key_value())
+            filter[self._m_parent_key] = self._m_get_parent_key_state()
         return filter
 
     def _m_add_items_filter(self, filter):
@@ -186,33 +481,75 @@ class MongoContainer(contained.Contained,
             if key not in filter:
                 filter[key] = value
 
+    def _m_match_doc(self, doc, key):
+        # Check whether a document found by another query is the item with
+        # the key. Raises a ValueError, if the items filter cannot be checked
+        # locally.
+        if doc.get(self._m_key_field) != self._m_key_value(key):
+            return False
+        for name, value in self._m_get_items_filter().items():
+            if value == {'$exists': True}:
+                if name not in doc:
+                    return False
+            elif isinstance(value, dict) and \
+                    any(op.startswith('$') for op in value):
+                raise ValueError('Unsupported items filter.', name, value)
+            elif doc.get(name) != value:
+                return False
+        return True
+
+    def _m_match_cached_doc(self, doc, key):
+        try:
+            return self._m_match_doc(doc, key)
+        except ValueError:
+            # The filter can only be checked by the server, so trust the
+            # cache like before.
+            return True
+
     @property
     def _cache(self):
+        # The caches live on the data manager, which is reset at the end of
+        # the transaction, so that they are discarded with it. Each operation
+        # should only look it up once.
         if not USE_CONTAINER_CACHE:
-            return {}
-        txn = transaction.manager.get()
-        if not hasattr(txn, '_v_mongo_container_cache'):
-            txn._v_mongo_container_cache = {}
-        return txn._v_mongo_container_cache.setdefault(self, {})
+            return ContainerCache()
+        jar = self._m_jar
+        cache = jar._container_caches.get(self)
+        if cache is None:
+            # Make sure that the data manager is reset when the transaction
+            # ends, even if nothing is loaded or modified.
+            if jar._needs_to_join:
+                jar.transaction_manager.get().join(jar)
+                jar._needs_to_join = False
+            cache = jar._container_caches[self] = ContainerCache(
+                CONTAINER_CACHE_SIZE, jar if RELEASE_EVICTED_ITEMS else None)
+        return cache
 
     @property
     def _cache_complete(self):
-        if not USE_CONTAINER_CACHE:
-            return False
-        txn = transaction.manager.get()
-        if not hasattr(txn, '_v_mongo_container_cache_complete'):
-            txn._v_mongo_container_cache_complete = {}
-        return txn._v_mongo_container_cache_complete.get(self, False)
-
-    def _cache_mark_complete(self):
-        txn = transaction.manager.get()
-        if not hasattr(txn, '_v_mongo_container_cache_complete'):
-            txn._v_mongo_container_cache_complete = {}
-        txn._v_mongo_container_cache_complete[self] = True
+        return self._cache.complete
 
     def _cache_get_key(self, doc):
         return doc[self._m_mapping_key]
 
+    def _key_cache_get(self, key):
+        if not USE_KEY_CACHE or self._p_oid is None:
+            return None
+        return KEY_CACHE.get((self._p_oid, key))
+
+    def _key_cache_put(self, key, obj):
+        # Objects inserted in this transaction might still be aborted.
+        if not USE_KEY_CACHE or self._p_oid is None or \
+                id(obj) in self._m_jar._inserted_objects:
+            return
+        KEY_CACHE.put((self._p_oid, key), obj._p_oid)
+
+    def _key_cache_invalidate(self, keys):
+        if not USE_KEY_CACHE or self._p_oid is None:
+            return
+        for key in keys:
+            KEY_CACHE.invalidate((self._p_oid, key))
+
     def _locate(self, obj, doc):
         # Helper method that is only used when locating items that are already
         # in the container and are simply loaded from Mongo.
@@ -221,20 +558,71 @@ class MongoContainer(contained.Contained,
         if obj.__parent__ is None:
             obj._v_parent = self
 
-    def _load_one(self, doc):
-        obj = self._cache.get(self._cache_get_key(doc))
+    def _m_iter_prefetched(self, docs, paths):
+        return self._m_jar.iter_prefetched(
+            docs, paths, self._m_database, self._m_collection)
+
+    def _load_one(self, doc, retain=True, full=True, cache=None):
+        if cache is None:
+            cache = self._cache
+        key = self._cache_get_key(doc)
+        obj = cache.get(key)
         if obj is not None:
             return obj
         # Create a DBRef object and then load the full state of the object.
         dbref = bson.dbref.DBRef(
             self._m_collection, doc['_id'],
             self._m_database or self._m_jar.default_database)
-        # Stick the doc into the _latest_states:
-        self._m_jar._latest_states[dbref] = doc
-        obj = self._m_jar.load(dbref)
-        self._locate(obj, doc)
+        klass = None
+        if full:
+            # Stick the doc into the _latest_states:
+            self._m_jar._latest_states[dbref] = doc
+        elif '_py_persistent_type' in doc:
+            # A partial document must not be used as the object's state, but
+            # it can still tell us the class of the object.
+            klass = self._m_jar._reader.simple_resolve(
+                doc['_py_persistent_type'])
+        obj = self._m_jar.load(dbref, klass)
+        if not full and obj._p_changed is None and \
+                isinstance(obj, MongoContained):
+            # Do not activate the ghost, since its state would have to be
+            # loaded. The location is kept in volatile attributes anyways and
+            # accessing the dictionary directly does not activate the object.
+            obj.__dict__.setdefault('_v_name', key)
+            obj.__dict__.setdefault('_v_parent', self)
+        else:
+            self._locate(obj, doc)
         # Add the object into the local container cache.
-        self._cache[obj.__name__] = obj
+        if retain:
+            cache[key] = obj
+        self._key_cache_put(key, obj)
+        return obj
+
+    def _load_cached_ref(self, key, cache):
+        # Load the item from the reference in the key cache without querying
+        # the items. Unless its state is known, the document is read by its
+        # id, which is needed to use the item anyway, to make sure it still
+        # exists.
+        dbref = self._key_cache_get(key)
+        if dbref is None:
+            return None
+        jar = self._m_jar
+        obj = jar._object_cache.get(hash(dbref))
+        if obj is None or obj._p_changed is None:
+            jar.load_states([dbref])
+            doc = jar._latest_states.get(dbref)
+            if doc is None or not self._m_match_cached_doc(doc, key):
+                # The entry is stale, so the items are queried instead.
+                invalidate_key_cache(self._p_oid, key)
+                return None
+        obj = jar.load(dbref)
+        if obj._p_changed is None and isinstance(obj, MongoContained):
+            obj.__dict__.setdefault('_v_name', key)
+            obj.__dict__.setdefault('_v_parent', self)
+        else:
+            obj._v_name = key
+            obj._v_parent = self
+        cache[key] = obj
         return obj
 
     def __cmp__(self, other):
@@ -245,15 +633,20 @@ class MongoContainer(contained.Contained,
 
     def __getitem__(self, key):
         # First check the container cache for the object.
-        obj = self._cache.get(key)
+        cache = self._cache
+        obj = cache.get(key)
         if obj is not None:
             return obj
-        if self._cache_complete:
+        if cache.complete:
             raise KeyError(key)
+        obj = self._load_cached_ref(key, cache)
+        if obj is not None:
+            return obj
         # The cache cannot help, so the item is looked up in the database.
         filter = self._m_get_items_filter()
         filter[self._m_mapping_key] = key
-        obj = self.find_one(filter)
+        doc = self.raw_find_one(filter)
+        obj = None if doc is None else self._load_one(doc, cache=cache)
         if obj is None:
             raise KeyError(key)
         return obj
@@ -283,9 +676,48 @@ class MongoContainer(contained.Contained,
                 # we have _m_mapping_key, use that attribute
                 key = getattr(value, self._m_mapping_key)
         # We want to be as close as possible to using the Zope semantics.
-        contained.setitem(self, self._real_setitem, key, value)
-        # Also add the item to the container cache.
-        self._cache[key] = value
+        if self._m_unique_keys and value._p_oid is None:
+            self._m_setitem_unique(key, value)
+        else:
+            contained.setitem(self, self._real_setitem, key, value)
+        # Also add the item to the container cache and forget the length.
+        cache = self._cache
+        cache[key] = value
+        cache.length = None
+        self._key_cache_invalidate([key])
+
+    def _m_setitem_unique(self, key, value):
+        # The unique index on the parent and mapping key rejects duplicate
+        # keys when the new object is inserted, so we do not need to check
+        # for an existing item first.
+        key = contained.checkAndConvertName(key)
+        # Write pending changes first, since an item removed or renamed in
+        # this transaction might still hold the key in the database.
+        self._m_jar.flush()
+        old_containment = (getattr(value, '__parent__', None),
+                           getattr(value, '__name__', None))
+        value, event = contained.containedEvent(value, self, key)
+        names = [name for name in (self._m_mapping_key, self._m_parent_key)
+                 if name is not None]
+        if self._m_mapping_key is not None:
+            setattr(value, self._m_mapping_key, key)
+        if self._m_parent_key is not None:
+            setattr(value, self._m_parent_key, self._m_get_parent_key_value())
+        try:
+            # The write must be acknowledged, otherwise the duplicate key is
+            # never reported.
+            self._m_jar.insert(value, self._m_get_new_id(key), safe=True)
+        except pymongo.errors.DuplicateKeyError:
+            for name in names:
+                try:
+                    delattr(value, name)
+                except AttributeError:
+                    pass
+            value.__parent__, value.__name__ = old_containment
+            raise KeyError(key)
+        if event:
+            zope.event.notify(event)
+            contained.notifyContainerModified(self)
 
     def add(self, value, key=None):
         # We are already supporting ``None`` valued keys, which prompts the key
@@ -293,6 +725,89 @@ class MongoContainer(contained.Contained,
         # interface would be better in this case.
         self[key] = value
 
+    def _m_get_new_id(self, key):
+        # The id under which a new object with the given key is inserted.
+        return None
+
+    def _m_get_keys_spec(self, keys):
+        return {self._m_mapping_key: {'$in': list(keys)}}
+
+    def _m_check_new_keys(self, keys):
+        seen = set()
+        for key in keys:
+            if key in seen:
+                raise KeyError(key)
+            seen.add(key)
+        cache = self._cache
+        if cache.complete:
+            existing = [key for key in keys if key in cache]
+        else:
+            fields = (self._m_mapping_key,) if self._m_mapping_key else ()
+            existing = [
+                self._cache_get_key(doc)
+                for doc in self.raw_find(self._m_get_keys_spec(keys), fields)]
+        if existing:
+            raise KeyError(existing[0])
+
+    def add_many(self, items, events=EVENTS_EACH):
+        if isinstance(items, dict):
+            items = items.items()
+        added = []
+        for key, value in items:
+            id = None
+            if key is None:
+                if self._m_mapping_key is not None:
+                    key = getattr(value, self._m_mapping_key)
+                elif value._p_oid is not None:
+                    key = unicode(value._p_oid.id)
+                else:
+                    # The object id is the key, so we choose it up front.
+                    id = bson.objectid.ObjectId()
+                    key = unicode(id)
+            # Validate the key like ``contained.setitem()`` does, before
+            # anything is written.
+            key = contained.checkAndConvertName(key)
+            if id is None and value._p_oid is None:
+                id = self._m_get_new_id(key)
+            added.append((key, value, id))
+        # Check all keys with a single query.
+        self._m_check_new_keys([key for key, value, id in added])
+
+        if self._m_parent_key is not None:
+            parent = self._m_get_parent_key_value()
+        new = []
+        new_ids = []
+        added_events = []
+        cache = self._cache
+        for key, value, id in added:
+            value, event = contained.containedEvent(value, self, key)
+            if event:
+                added_events.append(event)
+            # Set the key and parent before inserting, so that the new
+            # objects are complete with a single insert.
+            if self._m_mapping_key is not None:
+                setattr(value, self._m_mapping_key, key)
+            if self._m_parent_key is not None:
+                setattr(value, self._m_parent_key, parent)
+            if value._p_oid is None:
+                new.append(value)
+                new_ids.append(id)
+            cache[key] = value
+        self._m_jar.insert_many(new, new_ids)
+        cache.length = None
+        self._key_cache_invalidate([key for key, value, id in added])
+
+        if events == EVENTS_EACH:
+            for event in added_events:
+                zope.event.notify(event)
+                contained.notifyContainerModified(self)
+        elif events == EVENTS_BATCH:
+            for event in added_events:
+                zope.event.notify(event)
+            if added_events:
+                contained.notifyContainerModified(self)
+        return [key for key, value, id in added]
+
     def __delitem__(self, key):
         value = self[key]
         # First remove the parent and name from the object.
@@ -312,40 +827,127 @@ class MongoContainer(contained.Contained,
         if self._m_remove_documents:
             self._m_jar.remove(value)
         # Remove the object from the container cache.
-        if USE_CONTAINER_CACHE:
-            del self._cache[key]
+        cache = self._cache
+        cache.pop(key, None)
+        cache.length = None
+        self._key_cache_invalidate([key])
         # Send the uncontained event.
         contained.uncontained(value, self, key)
 
     def __contains__(self, key):
-        if self._cache_complete:
-            return key in self._cache
+        cache = self._cache
+        if cache.complete:
+            return key in cache
         return self.raw_find_one(
             {self._m_mapping_key: key}, fields=()) is not None
 
     def __iter__(self):
         # If the cache contains all objects, we can just return the cache keys.
-        if self._cache_complete:
-            return iter(self._cache)
+        cache = self._cache
+        if cache.complete:
+            return iter(list(cache))
+        # Only request the key, so that the query is covered by the index.
         result = self.raw_find(
-            {self._m_mapping_key: {'$ne': None}}, fields=(self._m_mapping_key,))
+            {self._m_mapping_key: {'$ne': None}},
+            fields={self._m_mapping_key: True, '_id': False})
         return iter(doc[self._m_mapping_key] for doc in result)
 
     def keys(self):
         return list(self.__iter__())
 
-    def iteritems(self):
+    def __len__(self):
+        cache = self._cache
+        if cache.complete:
+            return len(cache)
+        if cache.length is None:
+            # Let the server count the items instead of loading all keys.
+            cache.length = self.raw_find(fields=()).count()
+        return cache.length
+
+    def items(self):
+        return list(self.iteritems())
+
+    @property
+    def _m_key_field(self):
+        return self._m_mapping_key
+
+    def _m_key_value(self, key):
+        return key
+
+    def page(self, after_key=None, limit=50, reverse=False):
+        # Seeking to the last key of the previous page uses the index on the
+        # parent and key, so that deep pages are as fast as the first one.
+        field = self._m_key_field
+        spec = {}
+        if after_key is not None:
+            spec[field] = {'$lt' if reverse else '$gt':
+                           self._m_key_value(after_key)}
+        docs = self.raw_find(
+            spec, sort=[(field, -1 if reverse else 1)], limit=limit)
+        cache = self._cache
+        return [self._load_one(doc, cache=cache) for doc in docs]
+
+    def _m_find_keys(self, key_spec):
+        field = self._m_key_field
+        docs = self.raw_find(
+            {field: key_spec}, fields=(field,), sort=[(field, 1)])
+        return [self._cache_get_key(doc) for doc in docs]
+
+    def keys_between(self, low=None, high=None):
+        key_spec = {'$exists': True}
+        if low is not None:
+            key_spec['$gte'] = self._m_key_value(low)
+        if high is not None:
+            key_spec['$lt'] = self._m_key_value(high)
+        return self._m_find_keys(key_spec)
+
+    def keys_with_prefix(self, prefix):
+        return self._m_find_keys({'$regex': '^' + re.escape(prefix)})
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self, prefetch=None, stream=False, batch_size=None,
+                  retain=True):
         # If the cache contains all objects, we can just return the cache keys.
-        if self._cache_complete:
-            return self._cache.iteritems()
+        cache = self._cache
+        if cache.complete:
+            return iter(cache.items())
         result = self.raw_find()
-        items = [(doc[self._m_mapping_key], self._load_one(doc))
+        if batch_size is not None:
+            result = result.batch_size(batch_size)
+        result = self._m_iter_prefetched(result, prefetch)
+        if stream:
+            return self._m_stream_items(result, retain, cache)
+        items = [(self._cache_get_key(doc), self._load_one(doc, cache=cache))
                  for doc in result]
         # Signal the container that the cache is now complete.
-        self._cache_mark_complete()
+        cache.mark_complete(len(items))
         # Return an iterator of the items.
         return iter(items)
 
+    def _m_stream_items(self, docs, retain, cache):
+        jar = self._m_jar
+        count = 0
+        for doc in docs:
+            key = self._cache_get_key(doc)
+            obj = self._load_one(doc, retain, cache=cache)
+            yield key, obj
+            count += 1
+            if not retain and key not in cache:
+                # The object was handled, so the data manager should not keep
+                # it or its documents around for the rest of the transaction,
+                # unless it was modified.
+                jar.release(obj)
+        # Only a fully iterated and populated cache is complete.
+        if retain:
+            cache.mark_complete(count)
+
+    def itervalues(self, prefetch=None, stream=False, batch_size=None,
+                   retain=True):
+        items = self.iteritems(prefetch, stream, batch_size, retain)
+        return (obj for key, obj in items)
+
     def raw_find(self, spec=None, *args, **kwargs):
         if spec is None:
             spec = {}
@@ -353,13 +955,87 @@ class MongoContainer(contained.Contained,
         coll = self.get_collection()
         return coll.find(spec, *args, **kwargs)
 
+    def _m_get_ghost_fields(self):
+        fields = ['_py_persistent_type']
+        if self._m_mapping_key is not None:
+            fields.append(self._m_mapping_key)
+        return fields
+
+    def _m_prepare_find(self, args, kwargs):
+        # Returns whether the query returns full documents.
+        if kwargs.pop('ghost', False):
+            kwargs['fields'] = self._m_get_ghost_fields()
+        return not args and kwargs.get('fields') is None
+
     def find(self, spec=None, *args, **kwargs):
+        prefetch = kwargs.pop('prefetch', None)
+        full = self._m_prepare_find(args, kwargs)
         # Search for matching objects.
         result = self.raw_find(spec, *args, **kwargs)
+        if full:
+            result = self._m_iter_prefetched(result, prefetch)
+        cache = self._cache
         for doc in result:
-            obj = self._load_one(doc)
+            obj = self._load_one(doc, full=full, cache=cache)
             yield obj
 
+    def _m_get_join_collection(self, target):
+        # The target is either a collection name or the class of the
+        # referenced objects.
+        if isinstance(target, basestring):
+            return self._m_jar.default_database, target
+        return (getattr(target, '_p_mongo_database',
+                        self._m_jar.default_database),
+                getattr(target, '_p_mongo_collection',
+                        serialize.get_dotted_name(target)))
+
+    def raw_find_joined(self, joins, spec=None, sort=None, limit=None):
+        if spec is None:
+            spec = {}
+        self._m_add_items_filter(spec)
+        coll_db_name = self._m_database or self._m_jar.default_database
+        coll = self.get_collection()
+        pipeline = [
+            {'$match': datamanager.process_spec(coll.collection, spec)}]
+        if sort is not None:
+            pipeline.append({'$sort': bson.son.SON(sort)})
+        if limit is not None:
+            pipeline.append({'$limit': limit})
+        for name, target in sorted(joins.items()):
+            db_name, coll_name = self._m_get_join_collection(target)
+            if db_name != coll_db_name:
+                raise ValueError(
+                    'Cannot join across databases.', name, db_name)
+            # The id of a reference cannot be addressed with a field path,
+            # since its name starts with a dollar sign. But it is always the
+            # second field of the reference sub-document.
+            pipeline.append({'$addFields': {'_m_join_' + name: {
+                '$arrayElemAt': [{'$objectToArray': '$' + name}, 1]}}})
+            pipeline.append({'$lookup': {
+                'from': coll_name,
+                'localField': '_m_join_%s.v' % name,
+                'foreignField': '_id',
+                'as': '_m_join_' + name}})
+        if pymongo.version_tuple >= (3,):
+            # The driver always uses a command cursor.
+            return coll.aggregate(pipeline)
+        # Request a cursor, which MongoDB 3.6 and later require and which
+        # does not limit the results to a single 16MB reply.
+        return coll.aggregate(pipeline, cursor={})
+
+    def find_joined(self, joins, spec=None, sort=None, limit=None):
+        latest_states = self._m_jar._latest_states
+        cache = self._cache
+        for doc in self.raw_find_joined(joins, spec, sort, limit):
+            for name, target in joins.items():
+                db_name, coll_name = self._m_get_join_collection(target)
+                for joined in doc.pop('_m_join_' + name, ()):
+                    dbref = bson.dbref.DBRef(coll_name, joined['_id'], db_name)
+                    # Do not override states of this transaction.
+                    if dbref not in latest_states:
+                        latest_states[dbref] = joined
+            yield self._load_one(doc, cache=cache)
+
     def raw_find_one(self, spec_or_id=None, *args, **kwargs):
         if spec_or_id is None:
             spec_or_id = {}
@@ -370,18 +1046,74 @@ class MongoContainer(contained.Contained,
         return coll.find_one(spec_or_id, *args, **kwargs)
 
     def find_one(self, spec_or_id=None, *args, **kwargs):
+        prefetch = kwargs.pop('prefetch', None)
+        full = self._m_prepare_find(args, kwargs)
         doc = self.raw_find_one(spec_or_id, *args, **kwargs)
         if doc is None:
             return None
-        return self._load_one(doc)
+        if prefetch and full:
+            self._m_jar.prefetch([doc], prefetch)
+        return self._load_one(doc, full=full)
+
+    def delete_many(self, keys_or_filter, events=EVENTS_EACH):
+        if isinstance(keys_or_filter, dict):
+            keys = None
+            spec = keys_or_filter
+        else:
+            keys = list(keys_or_filter)
+            spec = self._m_get_keys_spec(keys)
+        # Load all items with a single query.
+        cache = self._cache
+        items = [(self._cache_get_key(doc), self._load_one(doc, cache=cache))
+                 for doc in self.raw_find(spec)]
+        if keys is not None:
+            found = set(key for key, value in items)
+            for key in keys:
+                if key not in found:
+                    raise KeyError(key)
+
+        for key, value in items:
+            # First remove the parent and name from the object.
+            for name in (self._m_mapping_key, self._m_parent_key):
+                if name is None:
+                    continue
+                try:
+                    delattr(value, name)
+                except AttributeError:
+                    # Sometimes we do not control those attributes.
+                    pass
+        # Let's now remove the objects from the database.
+        if self._m_remove_documents:
+            self._m_jar.remove_many([value for key, value in items])
+        # Remove the objects from the container cache.
+        for key, value in items:
+            cache.pop(key, None)
+        cache.length = None
+        self._key_cache_invalidate([key for key, value in items])
+
+        if events == EVENTS_EACH:
+            for key, value in items:
+                contained.uncontained(value, self, key)
+        else:
+            for key, value in items:
+                if value.__parent__ is not self or value.__name__ != key:
+                    continue
+                if events == EVENTS_BATCH:
+                    zope.event.notify(zope.lifecycleevent.ObjectRemovedEvent(
+                        value, self, key))
+                value.__parent__ = None
+                value.__name__ = None
+            if events == EVENTS_BATCH and items:
+                contained.notifyContainerModified(self)
+        return [key for key, value in items]
 
     def clear(self):
-        for key in self.keys():
-            del self[key]
+        self.delete_many({})
 
 
 class IdNamesMongoContainer(MongoContainer):
     """A container that uses the Mongo ObjectId as the name/key."""
+    zope.interface.implements(zinterfaces.IIdNamesMongoContainer)
     _m_mapping_key = None
 
     def __init__(self, collection=None, database=None, parent_key=None):
@@ -397,17 +1129,74 @@ class IdNamesMongoContainer(MongoContainer):
     def _cache_get_key(self, doc):
         return unicode(doc['_id'])
 
+    def _m_get_new_id(self, key):
+        return bson.objectid.ObjectId(key)
+
+    _m_key_field = '_id'
+
+    def _m_key_value(self, key):
+        return bson.objectid.ObjectId(key)
+
+    def keys_with_prefix(self, prefix):
+        # Object ids cannot be matched by a regular expression, but all ids
+        # with a given prefix are within a range.
+        try:
+            low = self._m_key_value(prefix.ljust(24, '0'))
+            high = self._m_key_value(prefix.ljust(24, 'f'))
+        except InvalidId:
+            return []
+        return self._m_find_keys({'$gte': low, '$lte': high})
+
+    def created_between(self, start=None, end=None, reverse=False,
+                        limit=None, batch_size=None):
+        # ObjectIds start with their creation time, so the time range is a
+        # range of ids.
+        id_spec = {}
+        if start is not None:
+            id_spec['$gte'] = bson.objectid.ObjectId.from_datetime(start)
+        if end is not None:
+            id_spec['$lt'] = bson.objectid.ObjectId.from_datetime(end)
+        spec = {'_id': id_spec} if id_spec else {}
+        kwargs = {}
+        if limit is not None:
+            kwargs['limit'] = limit
+        result = self.raw_find(
+            spec, fields=self._m_get_ghost_fields(),
+            sort=[('_id', -1 if reverse else 1)], **kwargs)
+        if batch_size is not None:
+            result = result.batch_size(batch_size)
+        cache = self._cache
+        for doc in result:
+            yield self._load_one(doc, full=False, cache=cache)
+
+    def newest(self, limit=None, batch_size=None):
+        return self.created_between(
+            reverse=True, limit=limit, batch_size=batch_size)
+
+    def _m_get_keys_spec(self, keys):
+        ids = []
+        for key in keys:
+            try:
+                ids.append(bson.objectid.ObjectId(key))
+            except InvalidId:
+                pass
+        return {'_id': {'$in': ids}}
+
     def _locate(self, obj, doc):
         obj._v_name = unicode(doc['_id'])
         obj._v_parent = self
 
     def __getitem__(self, key):
         # First check the container cache for the object.
-        obj = self._cache.get(key)
+        cache = self._cache
+        obj = cache.get(key)
         if obj is not None:
             return obj
-        if self._cache_complete:
+        if cache.complete:
             raise KeyError(key)
+        obj = self._load_cached_ref(key, cache)
+        if obj is not None:
+            return obj
         # We do not have a cache entry, so we look up the object.
         try:
             id = bson.objectid.ObjectId(key)
@@ -415,15 +1204,17 @@ class IdNamesMongoContainer(MongoContainer):
             raise KeyError(key)
         filter = self._m_get_items_filter()
         filter['_id'] = id
-        obj = self.find_one(filter)
+        doc = self.raw_find_one(filter)
+        obj = None if doc is None else self._load_one(doc, cache=cache)
         if obj is None:
             raise KeyError(key)
         return obj
 
     def __contains__(self, key):
         # If all objects are loaded, we can look in the local object cache.
-        if self._cache_complete:
-            return key in self._cache
+        cache = self._cache
+        if cache.complete:
+            return key in cache
         # Look in Mongo.
         try:
             id = bson.objectid.ObjectId(key)
@@ -433,25 +1224,13 @@ class IdNamesMongoContainer(MongoContainer):
 
     def __iter__(self):
         # If the cache contains all objects, we can just return the cache keys.
-        if self._cache_complete:
-            return iter(self._cache)
+        cache = self._cache
+        if cache.complete:
+            return iter(list(cache))
         # Look up all ids in Mongo.
-        result = self.raw_find(fields=None)
+        result = self.raw_find(fields=())
         return iter(unicode(doc['_id']) for doc in result)
 
-    def iteritems(self):
-        # If the cache contains all objects, we can just return the cache keys.
-        if self._cache_complete:
-            return self._cache.iteritems()
-        # Load all objects from the database.
-        result = self.raw_find()
-        items = [(unicode(doc['_id']), self._load_one(doc))
-                 for doc in result]
-        # Signal the container that the cache is now complete.
-        self._cache_mark_complete()
-        # Return an iterator of the items.
-        return iter(items)
-
     def _real_setitem(self, key, value):
         # We want mongo document ids to be our keys, so pass it to insert(), if
         # key is provided
@@ -467,3 +1246,97 @@ class AllItemsMongoContainer(MongoContainer):
 
 class SubDocumentMongoContainer(MongoContained, MongoContainer):
     _p_mongo_sub_object = True
+
+
+def resolve_paths(container, paths):
+    """Return the items at the paths of names below the container.
+
+    The paths are resolved level by level. The items of all paths on the same
+    level within ``MongoContainer`` objects sharing a collection are looked up
+    with a single query for their parent and key pairs, which is covered by
+    the index on the parent and key. The found items are put into the
+    container caches. Other containers are simply asked for their item.
+    """
+    paths = [[name for name in path.split('/') if name]
+             if isinstance(path, basestring) else list(path)
+             for path in paths]
+    objs = [container] * len(paths)
+    for depth in xrange(max([len(path) for path in paths] or [0])):
+        # (database, collection) -> {(id(obj), name): (obj, name, spec)}
+        lookups = {}
+        pending = []
+        for idx, path in enumerate(paths):
+            if depth >= len(path):
+                continue
+            obj, name = objs[idx], path[depth]
+            if not isinstance(obj, MongoContainer):
+                objs[idx] = obj[name]
+                continue
+            item = obj._cache.get(name)
+            if item is not None:
+                objs[idx] = item
+                continue
+            try:
+                spec = obj._m_get_items_filter()
+                spec[obj._m_key_field] = obj._m_key_value(name)
+            except (ValueError, InvalidId):
+                objs[idx] = obj[name]
+                continue
+            coll_key = (obj._m_database or obj._m_jar.default_database,
+                        obj._m_collection)
+            lookups.setdefault(coll_key, {})[(id(obj), name)] = (
+                obj, name, spec)
+            pending.append((idx, (id(obj), name)))
+        found = {}
+        for coll_lookups in lookups.values():
+            specs = [spec for obj, name, spec in coll_lookups.values()]
+            coll = coll_lookups.values()[0][0].get_collection()
+            docs = list(coll.find(
+                specs[0] if len(specs) == 1 else {'$or': specs}))
+            for lookup, (obj, name, spec) in coll_lookups.items():
+                try:
+                    matches = [doc for doc in docs
+                               if obj._m_match_doc(doc, name)]
+                except ValueError:
+                    found[lookup] = obj[name]
+                    continue
+                if not matches:
+                    raise KeyError(name)
+                found[lookup] = obj._load_one(matches[0], cache=obj._cache)
+        for idx, lookup in pending:
+            objs[idx] = found[lookup]
+    return objs
+
+
+def resolve_path(container, path):
+    """Return the item at the path of names below the container.
+
+    See ``resolve_paths()``.
+    """
+    return resolve_paths(container, [path])[0]
+
+
+def load_ancestors(objs):
+    """Load the states of the ancestors of all objects.
+
+    The ancestors are loaded level by level with one query per collection,
+    instead of one query for every ancestor.
+    """
+    seen = set()
+    level = list(objs)
+    while level:
+        parents = []
+        for obj in level:
+            parent = getattr(obj, '__parent__', None)
+            if parent is not None and id(parent) not in seen:
+                seen.add(id(parent))
+                parents.append(parent)
+        ghosts = {}
+        for parent in parents:
+            jar = getattr(parent, '_p_jar', None)
+            if interfaces.IMongoDataManager.providedBy(jar) and \
+                    parent._p_changed is None:
+                ghosts.setdefault(id(jar), (jar, []))[1].append(parent._p_oid)
+        for jar, dbrefs in ghosts.values():
+            jar.load_states(dbrefs)
+        level = parents
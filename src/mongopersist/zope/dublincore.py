@@ -14,28 +14,88 @@
 """Zope Dublin Core Mongo Backend Storage"""
 from UserDict import DictMixin
 
+import zope.datetime
 import zope.interface
 from zope.location import Location
 from zope.dublincore.interfaces import IWriteZopeDublinCore
 from zope.dublincore.zopedublincore import ZopeDublinCore
 from zope.security.proxy import removeSecurityProxy
 
+# The Dublin Core elements that are stored as native values, so that they can
+# be queried, sorted and indexed.
+DATE_FIELDS = {
+    'Date.Created': 'created',
+    'Date.Modified': 'modified',
+    'Date.Effective': 'effective',
+    'Date.Expires': 'expires',
+    }
+SEQUENCE_FIELDS = {
+    'Creator': 'creators',
+    }
+FIELDS = dict(DATE_FIELDS, **SEQUENCE_FIELDS)
+
+
+def to_utc(value):
+    """Convert a datetime to a naive UTC datetime as stored by Mongo."""
+    if value.utcoffset() is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    # Mongo only stores milliseconds.
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
 class DCDataWrapper(DictMixin):
 
     def __init__(self, data):
         self.data = data
 
+    def _normalize(self, key, value):
+        if key in SEQUENCE_FIELDS:
+            return list(value)
+        if len(value) != 1:
+            raise ValueError(value)
+        try:
+            return to_utc(zope.datetime.parseDatetimetz(value[0]))
+        except zope.datetime.DateTimeError:
+            raise ValueError(value)
+
     def __getitem__(self, key):
+        name = FIELDS.get(key)
+        if name is not None and name in self.data:
+            value = self.data[name]
+            if key in DATE_FIELDS:
+                return (unicode(to_utc(value).isoformat('T')) + u'+00:00',)
+            return tuple(value)
+        # Values that cannot be normalized and data written before the
+        # normalized fields existed are stored by their mangled key.
         return self.data[key.replace('.', '_')]
 
     def __setitem__(self, key, value):
+        name = FIELDS.get(key)
+        if name is not None:
+            try:
+                self.data[name] = self._normalize(key, value)
+            except ValueError:
+                self.data.pop(name, None)
+            else:
+                self.data.pop(key.replace('.', '_'), None)
+                return
         self.data[key.replace('.', '_')] = value
 
     def __delitem__(self, key):
+        name = FIELDS.get(key)
+        if name is not None and name in self.data:
+            del self.data[name]
+            self.data.pop(key.replace('.', '_'), None)
+            return
         del self.data[key.replace('.', '_')]
 
     def keys(self):
-        return [k.replace('_', '.') for k in self.data.keys()]
+        names = FIELDS.values()
+        keys = [k.replace('_', '.') for k in self.data.keys()
+                if k not in names]
+        keys.extend(key for key, name in sorted(FIELDS.items())
+                    if name in self.data and key not in keys)
+        return keys
 
 
 @zope.interface.implementer(IWriteZopeDublinCore)
@@ -54,3 +114,40 @@ class ZDCAnnotatableAdapter(ZopeDublinCore, Location):
 
     def _changed(self):
         self.__parent__._p_changed = True
+
+
+def get_indexes(parent_key=None):
+    """Return the index declarations used by the Dublin Core queries.
+
+    The declarations can be added to the ``_m_indexes`` of the containers
+    using the given parent key.
+    """
+    prefix = [(parent_key, 1)] if parent_key is not None else []
+    dc = ZDCAnnotatableAdapter.DCKEY
+    return [prefix + [(dc + '.modified', -1)],
+            prefix + [(dc + '.created', 1)]]
+
+
+def recently_modified(container, limit=None):
+    """Return the most recently modified items of the container as ghosts."""
+    field = ZDCAnnotatableAdapter.DCKEY + '.modified'
+    return container.find(
+        {field: {'$exists': True}}, sort=[(field, -1)], limit=limit or 0,
+        ghost=True)
+
+
+def created_between(container, start=None, end=None, reverse=False,
+                    limit=None):
+    """Return the items of the container created in the given time range.
+
+    The items are ordered by their creation date and returned as ghosts.
+    """
+    field = ZDCAnnotatableAdapter.DCKEY + '.created'
+    spec = {'$exists': True}
+    if start is not None:
+        spec['$gte'] = to_utc(start)
+    if end is not None:
+        spec['$lt'] = to_utc(end)
+    return container.find(
+        {field: spec}, sort=[(field, -1 if reverse else 1)],
+        limit=limit or 0, ghost=True)
@@ -51,6 +51,30 @@ class IMongoContainer(zope.interface.Interface):
             u'they are removed from the container.'),
         default=True)
 
+    _m_indexes = zope.schema.List(
+        title=u'Indexes',
+        description=(
+            u'Additional index declarations for the collection, see '
+            u'``mongopersist.indexes``.'),
+        default=[])
+
+    _m_unique_keys = zope.schema.Bool(
+        title=u'Unique Keys',
+        description=(
+            u'A flag when set causes the index on the parent and mapping key '
+            u'to be unique. New items are then inserted without checking for '
+            u'an existing item first and duplicate keys raise a ``KeyError``. '
+            u'The index must have been created with '
+            u'``mongopersist.indexes.ensure_indexes()``.'),
+        default=False)
+
+    def _m_get_indexes():
+        """Returns the index declarations of the container's collection.
+
+        By default a compound index on the parent and mapping key is
+        declared.
+        """
+
     def _m_get_parent_key_value():
         """Returns the value that is used to specify a particular container as
         the parent of the item.
@@ -72,6 +96,32 @@ class IMongoContainer(zope.interface.Interface):
         This can be useful to make custom queries against the collection.
         """
 
+    def iteritems(prefetch=None, stream=False, batch_size=None, retain=True):
+        """Return an iterator over all ``(key, object)`` pairs.
+
+        By default all items are loaded before the iterator is returned. If
+        ``stream`` is true, the items are loaded as the cursor delivers them,
+        where ``batch_size`` sets the cursor's batch size. If ``retain`` is
+        false, streamed items are not put into the container cache.
+        """
+
+    def itervalues(prefetch=None, stream=False, batch_size=None, retain=True):
+        """Return an iterator over all objects, see ``iteritems()``."""
+
+    def page(after_key=None, limit=50, reverse=False):
+        """Return the objects of the page following the given key.
+
+        The objects are ordered by key. Since the query seeks to the given
+        key using an index, every page is equally fast to compute.
+        """
+
+    def keys_between(low=None, high=None):
+        """Return the sorted keys from ``low`` (inclusive) to ``high``
+        (exclusive)."""
+
+    def keys_with_prefix(prefix):
+        """Return the sorted keys starting with the given prefix."""
+
     def raw_find(spec=None, *args, **kwargs):
         """Return a raw Mongo result set for the specified query.
 
@@ -83,14 +133,43 @@ class IMongoContainer(zope.interface.Interface):
     def find(spec=None, fields=None, *args, **kwargs):
         """Return a Python object result set for the specified query.
 
-        By default only the Mongo Id and key attribute is requested and a
-        ghost is created. The rest of the data is only retrieved if needed.
+        By default the full documents are requested, so that the returned
+        objects can be activated without another query.
 
         The spec is updated to also contain the container's filter spec.
 
+        The optional ``prefetch`` keyword argument is a list of dotted
+        attribute paths. The objects referenced along those paths are read
+        with one query per collection for each batch of results.
+
+        If the ``ghost`` keyword argument is true, only the id, key and type
+        of the documents are requested and true ghosts are returned. Partial
+        documents requested via ``fields`` are never used as object states.
+
         See pymongo's documentation for details on *args and **kwargs.
         """
 
+    def raw_find_joined(joins, spec=None, sort=None, limit=None):
+        """Return raw Mongo documents joined with referenced documents.
+
+        ``joins`` maps attribute names holding single references to the
+        collection name or class of the referenced objects. The referenced
+        documents are looked up by an aggregation pipeline and stored in the
+        ``_m_join_<name>`` field of each document. The documents are
+        returned by a command cursor.
+
+        ``sort`` is a list of ``(key, direction)`` pairs. The pipeline
+        requires MongoDB 3.4.4 or later and pymongo 2.6 or later.
+        """
+
+    def find_joined(joins, spec=None, sort=None, limit=None):
+        """Return the Python objects for the specified query.
+
+        The documents of the referenced objects are fetched in the same round
+        trip (see ``raw_find_joined()``), so that the referenced objects can
+        be activated without further queries.
+        """
+
     def raw_find_one(spec_or_id=None, *args, **kwargs):
         """Return a raw Mongo document for the specified query.
 
@@ -104,6 +183,9 @@ class IMongoContainer(zope.interface.Interface):
 
         The spec is updated to also contain the container's filter spec.
 
+        The optional ``prefetch`` keyword argument is handled like in
+        ``find()``.
+
         See pymongo's documentation for details on *args and **kwargs.
         """
 
@@ -115,9 +197,51 @@ class IMongoContainer(zope.interface.Interface):
         - otherwise getattr(value, _m_mapping_key)
         """
 
+    def add_many(items, events='each'):
+        """Add many objects with a single insert and return their keys.
+
+        ``items`` is a mapping or a sequence of ``(key, value)`` pairs. A key
+        of ``None`` is chosen like in ``add()``. All keys are validated and
+        checked for existing items with a single query before anything is
+        added.
+
+        ``events`` is one of the ``EVENTS_*`` constants of
+        ``mongopersist.zope.container``: an added and a container modified
+        event for every item (``'each'``), the added events followed by a
+        single container modified event (``'batch'``) or no events at all
+        (``'none'``).
+        """
+
+    def delete_many(keys_or_filter, events='each'):
+        """Delete many items and return their keys.
+
+        ``keys_or_filter`` is either a sequence of keys or a query spec that
+        is restricted to the items of this container. The items are loaded
+        with a single query and unknown keys raise a ``KeyError`` before
+        anything is deleted. ``events`` is handled like in ``add_many()``.
+        """
+
     def clear(self):
         """Delete all items from this container.
 
         Note, that this will not touch all items from the collection, but only
         those, specified in _m_get_items_filter.
         """
+
+
+class IIdNamesMongoContainer(IMongoContainer):
+    """A container using the Mongo ObjectIds of its items as keys."""
+
+    def created_between(start=None, end=None, reverse=False, limit=None,
+                        batch_size=None):
+        """Return an iterator of the items created from ``start``
+        (inclusive) to ``end`` (exclusive).
+
+        The creation time is part of the ObjectId, so the query uses the
+        ``_id`` index. The datetimes are in UTC, unless they have a
+        timezone. The items are returned as ghosts ordered by creation time,
+        newest first if ``reverse`` is set.
+        """
+
+    def newest(limit=None, batch_size=None):
+        """Return an iterator of the newest items, newest first."""
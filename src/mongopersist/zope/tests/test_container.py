@@ -13,6 +13,8 @@
 ##############################################################################
 """Mongo Persistence Doc Tests"""
 import atexit
+import bson.dbref
+import bson.objectid
 import doctest
 import unittest
 
@@ -33,7 +35,7 @@ from zope.container import contained, btree
 from zope.testing import cleanup, module, renormalizing
 
 from mongopersist import datamanager, interfaces, serialize, testing
-from mongopersist.zope import container
+from mongopersist.zope import annotation, container, dublincore
 
 DBNAME = 'mongopersist_container_test'
 
@@ -45,6 +47,11 @@ class ApplicationRoot(container.SimpleMongoContainer):
         return '<ApplicationRoot>'
 
 
+class BucketedPeople(container.BucketedMongoContainer):
+    _p_mongo_collection = 'bucketed'
+    _m_bucket_size = 2
+
+
 class SimplePerson(contained.Contained, persistent.Persistent):
     _p_mongo_collection = 'person'
 
@@ -62,6 +69,13 @@ class Person(container.MongoContained, SimplePerson):
     pass
 
 
+class AnnotatedPerson(SimplePerson):
+    zope.interface.implements(annotation.IMongoDocumentAnnotatable)
+
+    def _p_mongo_get_dependents(self):
+        return annotation.get_stored_annotations(self)
+
+
 def doctest_MongoContained_simple():
     """MongoContained: simple use
 
@@ -361,6 +375,96 @@ def doctest_SimpleMongoContainer_basic():
     """
 
 
+def doctest_BucketedMongoContainer():
+    """BucketedMongoContainer: items stored in bucket documents
+
+    A bucketed container works like a simple container, but spreads its items
+    over several documents, so that no document grows without bounds:
+
+      >>> dm.root['c'] = BucketedPeople()
+      >>> for name in (u'adam', u'marius', u'roy', u'stephan', u'albertas'):
+      ...     dm.root['c'][name] = SimplePerson(name.capitalize())
+      >>> transaction.commit()
+
+      >>> c = dm.root['c']
+      >>> c.keys()
+      [u'adam', u'albertas', u'marius', u'roy', u'stephan']
+      >>> len(c)
+      5
+      >>> c[u'roy'].__parent__ is c
+      True
+
+    The container document only references the buckets, which are split once
+    they are larger than the bucket size:
+
+      >>> db = dm._conn[DBNAME]
+      >>> db['bucketed'].find_one()['bucket_keys']
+      [u'marius', u'roy']
+      >>> cn = 'mongopersist.zope.container.ContainerBucket'
+      >>> sorted(sorted(doc['data']) for doc in db[cn].find())
+      [[u'adam', u'albertas'], [u'marius'], [u'roy', u'stephan']]
+
+    Looking up an item only loads the bucket holding its key:
+
+      >>> transaction.commit()
+      >>> c = dm.root['c']
+      >>> c[u'stephan']
+      <SimplePerson Stephan>
+      >>> [bucket._p_changed for bucket in c._SampleContainer__data.buckets]
+      [None, None, False]
+
+    The container document keeps the number of items, so no bucket is loaded
+    to compute the length:
+
+      >>> db['bucketed'].find_one()['length']
+      5
+      >>> transaction.commit()
+      >>> c = dm.root['c']
+      >>> len(c)
+      5
+      >>> [bucket._p_changed for bucket in c._SampleContainer__data.buckets]
+      [None, None, None]
+
+    Empty buckets are removed:
+
+      >>> del c[u'marius']
+      >>> transaction.commit()
+      >>> db['bucketed'].find_one()['bucket_keys']
+      [u'roy']
+      >>> db[cn].count()
+      2
+      >>> dm.root['c'].items()
+      [(u'adam', <SimplePerson Adam>), (u'albertas', <SimplePerson Albertas>),
+       (u'roy', <SimplePerson Roy>), (u'stephan', <SimplePerson Stephan>)]
+
+    Documents of simple containers are moved into buckets on the first
+    change:
+
+      >>> stephan = dm.root['c'][u'stephan']
+      >>> id = db['bucketed'].insert({'data': {u'stephan': stephan._p_oid}})
+      >>> old = dm.load(
+      ...     bson.dbref.DBRef('bucketed', id, DBNAME), BucketedPeople)
+      >>> old.keys()
+      [u'stephan']
+      >>> old[u'roy'] = SimplePerson(u'Roy')
+      >>> transaction.commit()
+      >>> doc = db['bucketed'].find_one({'_id': id})
+      >>> 'data' in doc, len(doc['buckets']), doc['length']
+      (False, 1, 2)
+
+    The buckets are removed along with their container:
+
+      >>> db[cn].count()
+      3
+      >>> dm.remove(dm.root['c'])
+      >>> dm.remove_many(
+      ...     [dm.load(bson.dbref.DBRef('bucketed', id, DBNAME))])
+      >>> transaction.commit()
+      >>> db[cn].count()
+      0
+    """
+
+
 def doctest_MongoContainer_basic():
     """MongoContainer: basic
 
@@ -524,6 +628,17 @@ def doctest_MongoContainer_m_parent_key_value():
 
     In that final case, the container itself is returned, because upon
     serialization, we simply look up the dbref.
+
+    The serialized parent is used by the items filter. It is computed only
+    once for the oid of the container:
+
+      >>> c._m_get_items_filter()
+      {'parent': DBRef('mongopersist.zope.container.MongoContainer',
+                       ObjectId('4e7ddf12e138237403000000'),
+                       'mongopersist_container_test'),
+       'key': {'$exists': True}}
+      >>> c._v_m_parent_key_state[0] == c._p_oid
+      True
     """
 
 def doctest_MongoContainer_many_items():
@@ -728,11 +843,9 @@ def doctest_MongoContainer_cache_complete():
       >>> ppl[u'albertas'] = Person(u'Albertas')
       >>> ppl[u'russ'] = Person(u'Russ')
 
-    Clean the cache on the transaction:
+    Clean the caches of the transaction, which are kept by the data manager:
 
-      >>> txn = transaction.manager.get()
-      >>> if hasattr(txn, '_v_mongo_container_cache'):
-      ...     delattr(txn, '_v_mongo_container_cache')
+      >>> dm._container_caches.clear()
 
     The cache is not complete:
 
@@ -783,6 +896,78 @@ def doctest_MongoContainer_cache_complete():
 
     """
 
+def doctest_MongoContainer_cache_size():
+    """MongoContainer: bounded container cache
+
+    The container cache of a transaction only keeps the most recently used
+    items:
+
+      >>> container.CONTAINER_CACHE_SIZE = 2
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> people['Mr Number 00000'].age
+      0
+      >>> evicted = people['Mr Number 00001']
+      >>> people['Mr Number 00000'].age
+      0
+      >>> people['Mr Number 00002'].age
+      2
+      >>> 'Mr Number 00001' in people._cache
+      False
+      >>> len(people._cache) <= 2
+      True
+
+    By default the data manager still knows the evicted item, so it stays
+    active and loading it again returns the same object:
+
+      >>> evicted._p_changed
+      False
+      >>> people['Mr Number 00001'] is evicted
+      True
+
+    Optionally, evicted items are released by the data manager as well, so
+    that their memory is freed:
+
+      >>> container.RELEASE_EVICTED_ITEMS = True
+      >>> transaction.commit()
+      >>> import gc, weakref
+      >>> people = dm.root['people']
+      >>> evicted = weakref.ref(people['Mr Number 00001'])
+      >>> people['Mr Number 00000'].age
+      0
+      >>> people['Mr Number 00002'].age
+      2
+      >>> _ = gc.collect()
+      >>> (evicted() is None) == container.USE_CONTAINER_CACHE
+      True
+      >>> container.RELEASE_EVICTED_ITEMS = False
+
+    Since items were evicted while loading all items, the cache is not
+    complete:
+
+      >>> sorted(key for key, person in people.items())
+      [u'Mr Number 00000', u'Mr Number 00001', u'Mr Number 00002']
+      >>> people._cache_complete
+      False
+      >>> len(people)
+      3
+
+    All items fit into a large enough cache:
+
+      >>> container.CONTAINER_CACHE_SIZE = 10000
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> len(people.items())
+      3
+      >>> people._cache_complete == container.USE_CONTAINER_CACHE
+      True
+    """
+
 def doctest_IdNamesMongoContainer_basic():
     """IdNamesMongoContainer: basic
 
@@ -866,6 +1051,42 @@ def doctest_IdNamesMongoContainer_basic():
       []
     """
 
+def doctest_IdNamesMongoContainer_created_between():
+    """IdNamesMongoContainer: created_between() and newest()
+
+    The ObjectId keys of the container contain the creation time of the
+    items, so they can be queried by time without another index:
+
+      >>> import datetime
+      >>> def created(hour):
+      ...     return datetime.datetime(2013, 1, 1, hour)
+
+      >>> transaction.commit()
+      >>> dm.root['c'] = c = container.IdNamesMongoContainer('person')
+      >>> for hour in (1, 2, 3):
+      ...     id = bson.objectid.ObjectId.from_datetime(created(hour))
+      ...     c[unicode(id)] = Person(u'Person %i' % hour)
+      >>> transaction.commit()
+
+      >>> c = dm.root['c']
+      >>> found = list(c.created_between(created(1), created(3)))
+      >>> [person._p_changed for person in found]
+      [None, None]
+      >>> [person.name for person in found]
+      [u'Person 1', u'Person 2']
+      >>> found[0].__parent__ is c
+      True
+
+      >>> [person.name for person in c.created_between(start=created(2))]
+      [u'Person 2', u'Person 3']
+
+    The newest items can be iterated first:
+
+      >>> [person.name for person in c.newest(limit=2, batch_size=1)]
+      [u'Person 3', u'Person 2']
+    """
+
+
 def doctest_AllItemsMongoContainer_basic():
     """AllItemsMongoContainer: basic
 
@@ -1179,6 +1400,13 @@ def doctest_Realworldish():
     """
 
 
+class Folder(container.MongoContained, container.MongoContainer):
+    _p_mongo_collection = 'folder'
+    _m_collection = 'folder'
+    _m_name_attr = 'key'
+    _m_parent_attr = 'parent'
+
+
 class People(container.AllItemsMongoContainer):
     _m_mapping_key = 'name'
     _p_mongo_collection = 'people'
@@ -1239,6 +1467,632 @@ def doctest_load_does_not_set_p_changed():
     """
 
 
+def doctest_MongoContainer_find_prefetch():
+    """MongoContainer: find() with prefetching of references
+
+    Let's add some people, each having an address:
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+    When the addresses of the found people are needed anyway, they can be
+    read together, instead of with one query per person:
+
+      >>> people = dm.root['people']
+      >>> found = list(people.find(prefetch=['address']))
+      >>> len([ref for ref in dm._latest_states if ref.collection == 'address'])
+      3
+      >>> [person.address.city for person in found]
+      [u'Boston 0', u'Boston 1', u'Boston 2']
+
+    The same works for ``find_one()`` and ``iteritems()``:
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> people.find_one({'name': 'Mr Number 00001'}, prefetch=['address'])
+      <PeoplePerson Mr Number 00001 @ 1 [Mr Number 00001]>
+      >>> len([ref for ref in dm._latest_states if ref.collection == 'address'])
+      1
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> items = list(people.iteritems(prefetch=['address']))
+      >>> len([ref for ref in dm._latest_states if ref.collection == 'address'])
+      3
+    """
+
+
+def doctest_MongoContainer_find_joined():
+    """MongoContainer: find_joined()
+
+    For listings, the documents of referenced objects can be fetched together
+    with the items in a single round trip, using an aggregation pipeline:
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> found = list(people.find_joined(
+      ...     {'address': Address}, sort=[('name', 1)], limit=2))
+      >>> found
+      [<PeoplePerson Mr Number 00000 @ 0 [Mr Number 00000]>,
+       <PeoplePerson Mr Number 00001 @ 1 [Mr Number 00001]>]
+
+    The joined documents are known to the data manager, so that the addresses
+    can be activated without another query:
+
+      >>> len([ref for ref in dm._latest_states if ref.collection == 'address'])
+      2
+      >>> [person.address.city for person in found]
+      [u'Boston 0', u'Boston 1']
+
+    The raw documents carry the joined documents:
+
+      >>> doc = list(people.raw_find_joined(
+      ...     {'address': 'address'}, {'name': 'Mr Number 00002'}))[0]
+      >>> [addr['city'] for addr in doc['_m_join_address']]
+      [u'Boston 2']
+    """
+
+
+def doctest_MongoContainer_iteritems_stream():
+    """MongoContainer: iteritems() streaming
+
+    By default ``iteritems()`` loads all items before returning. For very
+    large containers, the items can be streamed from the cursor instead:
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> items = people.iteritems(stream=True, batch_size=2)
+      >>> items.next()
+      (u'Mr Number 00000', <PeoplePerson Mr Number 00000 @ 0 [Mr Number 00000]>)
+      >>> people._cache_complete
+      False
+
+    Only once the iteration is complete, the container cache is known to be
+    complete:
+
+      >>> sorted(key for key, obj in items)
+      [u'Mr Number 00001', u'Mr Number 00002']
+      >>> people._cache_complete == container.USE_CONTAINER_CACHE
+      True
+
+    When processing all items in a batch job, the items can also be
+    forgotten as soon as they have been handled:
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> [person.age for person in people.itervalues(stream=True, retain=False)]
+      [0, 1, 2]
+      >>> people._cache
+      {}
+      >>> people._cache_complete
+      False
+
+    The data manager does not keep the handled items or their states either,
+    so that they can be garbage collected:
+
+      >>> streamed = [person._p_oid for person in people.itervalues(
+      ...     stream=True, retain=False)]
+      >>> [oid for oid in streamed
+      ...  if hash(oid) in dm._object_cache or oid in dm._latest_states or
+      ...     oid in dm._original_states]
+      []
+      >>> [obj for obj in dm._loaded_objects.values()
+      ...  if isinstance(obj, PeoplePerson)]
+      []
+
+    Modified items are kept, so that their changes are written:
+
+      >>> for person in people.itervalues(stream=True, retain=False):
+      ...     person.age += 10
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> sorted(person.age for person in people.values())
+      [10, 11, 12]
+    """
+
+
+def doctest_MongoContainer_len_values_items():
+    """MongoContainer: __len__(), values() and items()
+
+    The length of a container is counted by the server:
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> len(people)
+      3
+
+    The count is remembered for the transaction, but adding and deleting
+    items forgets it:
+
+      >>> people[None] = PeoplePerson('Mr Number 00003', 3)
+      >>> len(people)
+      4
+      >>> del people['Mr Number 00000']
+      >>> len(people)
+      3
+
+    ``values()`` and ``items()`` load all items with a single query:
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> [person.age for person in people.values()]
+      [1, 2, 3]
+      >>> sorted(key for key, person in people.items())
+      [u'Mr Number 00001', u'Mr Number 00002', u'Mr Number 00003']
+    """
+
+
+def doctest_resolve_path():
+    """resolve_path() and load_ancestors()
+
+    Let's create some nested folders, which store their items in the same
+    collection:
+
+      >>> transaction.commit()
+      >>> dm.root['top'] = top = Folder()
+      >>> top['a'] = Folder()
+      >>> top['a']['b'] = Folder()
+      >>> top['a']['b']['c'] = Folder()
+      >>> top['b'] = Folder()
+      >>> transaction.commit()
+
+    The path is looked up level by level, with a query for the parent and
+    key of each level:
+
+      >>> top = dm.root['top']
+      >>> c = container.resolve_path(top, '/a/b/c')
+      >>> c.__name__
+      u'c'
+      >>> c.__parent__.__parent__ is top['a']
+      True
+
+    The found items are put into the caches of their containers:
+
+      >>> b = top['a']['b']
+      >>> b._cache.get('c') is c or not container.USE_CONTAINER_CACHE
+      True
+
+    Missing items raise a key error:
+
+      >>> container.resolve_path(top, ['a', 'x'])
+      Traceback (most recent call last):
+      ...
+      KeyError: 'x'
+
+    Several paths are resolved together, using one query per level for all
+    of them. Only the items on the paths are found, even though there are
+    other items with the same names:
+
+      >>> transaction.commit()
+      >>> top = dm.root['top']
+      >>> [item.__name__ for item in container.resolve_paths(
+      ...     top, ['a/b/c', 'b', 'a/b'])]
+      [u'c', u'b', u'b']
+      >>> [item.__parent__ is top
+      ...  for item in container.resolve_paths(top, ['a/b', 'b'])]
+      [False, True]
+
+    The ancestors of many objects can be loaded with a query per level:
+
+      >>> transaction.commit()
+      >>> c = dm.load(c._p_oid)
+      >>> container.load_ancestors([c])
+      >>> b = c.__parent__
+      >>> b._p_changed, b.__name__
+      (False, u'b')
+      >>> a = b.__parent__
+      >>> a._p_changed, a.__name__
+      (False, u'a')
+      >>> a.__parent__.__parent__ is None
+      True
+    """
+
+
+def doctest_MongoContainer_key_cache():
+    """MongoContainer: process wide key cache
+
+    When enabled, the references of looked up items are remembered across
+    transactions:
+
+      >>> container.USE_KEY_CACHE = True
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(2):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> people['Mr Number 00000'].age
+      0
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> container.KEY_CACHE.get((people._p_oid, 'Mr Number 00000'))
+      DBRef('person', ObjectId('4e7ddf12e138237403000000'),
+            'mongopersist_container_test')
+
+    So the next lookup does not need to query the key. The document is read
+    by its id, which is needed to use the item anyway, and the item is
+    returned as a ghost:
+
+      >>> person = people['Mr Number 00000']
+      >>> person._p_changed is None
+      True
+      >>> person._p_oid in dm._latest_states
+      True
+      >>> person.__name__, person.age
+      (u'Mr Number 00000', 0)
+
+    Adding and deleting items invalidates their entries:
+
+      >>> del people['Mr Number 00000']
+      >>> container.KEY_CACHE.get((people._p_oid, 'Mr Number 00000'))
+      >>> people['Mr Number 00000']
+      Traceback (most recent call last):
+      ...
+      KeyError: 'Mr Number 00000'
+
+    Other processes can signal changes by invalidating keys or clearing the
+    cache:
+
+      >>> people['Mr Number 00001'].age
+      1
+      >>> container.invalidate_key_cache(people._p_oid, 'Mr Number 00001')
+      >>> container.KEY_CACHE.get((people._p_oid, 'Mr Number 00001'))
+      >>> container.invalidate_key_cache()
+
+    Reading the document notices items removed by other processes, even
+    though the cache entry is still there:
+
+      >>> people['Mr Number 00001'].age
+      1
+      >>> transaction.commit()
+      >>> _ = dm._conn[DBNAME]['person'].remove({'name': 'Mr Number 00001'})
+
+      >>> people = dm.root['people']
+      >>> people['Mr Number 00001']
+      Traceback (most recent call last):
+      ...
+      KeyError: 'Mr Number 00001'
+      >>> 'Mr Number 00001' in people
+      False
+      >>> container.KEY_CACHE.get((people._p_oid, 'Mr Number 00001'))
+
+      >>> container.USE_KEY_CACHE = False
+    """
+
+
+def doctest_MongoContainer_indexes():
+    """MongoContainer: index declarations
+
+    Containers declare a compound index on the parent and mapping key, which
+    is used by all item lookups:
+
+      >>> container.MongoContainer('person')._m_get_indexes()
+      [[('parent', 1), ('key', 1)]]
+
+    Containers without a parent key only index the mapping key and further
+    indexes can be declared:
+
+      >>> people = People()
+      >>> people._m_indexes = ['age']
+      >>> people._m_get_indexes()
+      [[('name', 1)], 'age']
+
+    The indexes are created by ``mongopersist.indexes.ensure_indexes()``:
+
+      >>> from mongopersist import indexes
+      >>> created, redundant = indexes.ensure_indexes(dm, containers=[people])
+      >>> [name for db_name, coll_name, name in created
+      ...  if coll_name == 'person']
+      ['name_1', 'age_1']
+    """
+
+
+def doctest_MongoContainer_unique_keys():
+    """MongoContainer: unique keys
+
+    When the container relies on a unique index for its keys, new items are
+    added without looking for an existing item first:
+
+      >>> class UniquePeople(People):
+      ...     _m_parent_key = 'parent'
+      ...     _m_unique_keys = True
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = UniquePeople()
+      >>> pprint(UniquePeople()._m_get_indexes())
+      [([('parent', 1), ('name', 1)], {'sparse': True, 'unique': True})]
+
+      >>> from mongopersist import indexes
+      >>> created, redundant = indexes.ensure_indexes(dm, containers=[people])
+
+      >>> people[u'stephan'] = PeoplePerson(u'stephan', 33)
+      >>> people[u'stephan'].name
+      u'stephan'
+      >>> people[u'stephan'].__parent__ is people
+      True
+
+    A duplicate key is rejected by the server and results in the usual error:
+
+      >>> addresses = dm._conn[DBNAME]['address'].count()
+      >>> person = PeoplePerson(u'stephan', 34)
+      >>> people[u'stephan'] = person
+      Traceback (most recent call last):
+      ...
+      KeyError: u'stephan'
+      >>> person._p_oid is None
+      True
+      >>> person.__parent__ is None and person.__name__ is None
+      True
+
+    New objects referenced by the rejected item were stored to get their
+    references, but are removed again:
+
+      >>> person.address._p_oid is None
+      True
+      >>> dm._conn[DBNAME]['address'].count() == addresses
+      True
+
+    Pending changes are written before inserting, so that a key which was
+    given up in this transaction can be used again, even if the document of
+    the old item is kept:
+
+      >>> class KeepingPeople(UniquePeople):
+      ...     _p_mongo_collection = 'keeping_people'
+      ...     _m_remove_documents = False
+
+      >>> dm.root['keeping'] = keeping = KeepingPeople()
+      >>> keeping[u'roy'] = PeoplePerson(u'roy', 1)
+      >>> del keeping[u'roy']
+      >>> keeping[u'roy'] = PeoplePerson(u'roy', 2)
+      >>> keeping[u'roy'].age
+      2
+
+    The keys are checked like in any other container:
+
+      >>> people[42] = PeoplePerson(u'42', 42)
+      Traceback (most recent call last):
+      ...
+      TypeError: name not unicode or ascii string
+      >>> people[u''] = PeoplePerson(u'', 42)
+      Traceback (most recent call last):
+      ...
+      ValueError: empty names are not allowed
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> [person.age for person in people.values()]
+      [33]
+
+    Containers using the object ids as keys insert the new items under the
+    id of their key:
+
+      >>> class UniqueIdPeople(container.IdNamesMongoContainer):
+      ...     _p_mongo_collection = 'unique_people'
+      ...     _m_collection = 'person'
+      ...     _m_parent_key = 'parent'
+      ...     _m_unique_keys = True
+
+      >>> dm.root['ids'] = ids = UniqueIdPeople()
+      >>> key = u'4e7ddf12e138237403000042'
+      >>> ids[key] = PeoplePerson(u'roy', 42)
+      >>> transaction.commit()
+
+      >>> ids = dm.root['ids']
+      >>> ids[key].name
+      u'roy'
+      >>> list(ids.keys()) == [key]
+      True
+    """
+
+
+def doctest_MongoContainer_add_many_delete_many():
+    """MongoContainer: add_many() and delete_many()
+
+    Many items can be added with a single insert:
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> people.add_many(
+      ...     [(None, PeoplePerson('Mr Number %.5i' %idx, idx))
+      ...      for idx in xrange(4)])
+      [u'Mr Number 00000', u'Mr Number 00001', u'Mr Number 00002',
+       u'Mr Number 00003']
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> sorted(people.keys())
+      [u'Mr Number 00000', u'Mr Number 00001', u'Mr Number 00002',
+       u'Mr Number 00003']
+      >>> people['Mr Number 00002'].__parent__ is people
+      True
+
+    Existing keys are rejected before anything is added:
+
+      >>> people.add_many({u'Mr Number 00001': PeoplePerson('Mr Number', 1),
+      ...                  u'Mr Number 00009': PeoplePerson('Mr Number', 9)})
+      Traceback (most recent call last):
+      ...
+      KeyError: u'Mr Number 00001'
+
+    Keys are validated like when setting a single item:
+
+      >>> people.add_many([(42, PeoplePerson('Mr Number', 42))])
+      Traceback (most recent call last):
+      ...
+      TypeError: name not unicode or ascii string
+      >>> people.add_many([(u'Mr Number 00009', PeoplePerson('Mr Number', 9)),
+      ...                  (u'', PeoplePerson('Mr Number', 10))])
+      Traceback (most recent call last):
+      ...
+      ValueError: empty names are not allowed
+      >>> u'Mr Number 00009' in people
+      False
+
+    This includes the keys taken from the items:
+
+      >>> people.add_many([(None, PeoplePerson(u'', 10))])
+      Traceback (most recent call last):
+      ...
+      ValueError: empty names are not allowed
+
+    Items can be deleted by key or by a query filter:
+
+      >>> people.delete_many(['Mr Number 00000', 'Mr Number 00001'])
+      [u'Mr Number 00000', u'Mr Number 00001']
+      >>> people.delete_many({'age': {'$gt': 2}})
+      [u'Mr Number 00003']
+      >>> transaction.commit()
+
+      >>> people = dm.root['people']
+      >>> people.keys()
+      [u'Mr Number 00002']
+
+    Unknown keys cause a ``KeyError``:
+
+      >>> people.delete_many(['Mr Number 00002', 'Mr Number 00007'])
+      Traceback (most recent call last):
+      ...
+      KeyError: 'Mr Number 00007'
+
+    By default an event is sent for every item, like when adding items one
+    by one. For imports, the events can be batched with a single container
+    modified event, or suppressed entirely:
+
+      >>> @zope.component.adapter(zope.component.interfaces.IObjectEvent)
+      ... def eventHandler(event):
+      ...     print event.__class__.__name__
+      >>> zope.component.provideHandler(eventHandler)
+
+      >>> people.add_many(
+      ...     [(None, PeoplePerson('Mr Number %.5i' %idx, idx))
+      ...      for idx in (5, 6)], events=container.EVENTS_BATCH)
+      ObjectAddedEvent
+      ObjectAddedEvent
+      ContainerModifiedEvent
+      [u'Mr Number 00005', u'Mr Number 00006']
+
+      >>> people.delete_many(
+      ...     ['Mr Number 00005', 'Mr Number 00006'],
+      ...     events=container.EVENTS_NONE)
+      [u'Mr Number 00005', u'Mr Number 00006']
+    """
+
+
+def doctest_MongoContainer_page_and_key_ranges():
+    """MongoContainer: page(), keys_between() and keys_with_prefix()
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for name in ('adam', 'anna', 'bob', 'carl', 'cindy'):
+      ...     people[name] = PeoplePerson(name, len(name))
+      >>> transaction.commit()
+
+    Large containers are paged by remembering the last key of a page:
+
+      >>> people = dm.root['people']
+      >>> [person.name for person in people.page(limit=2)]
+      [u'adam', u'anna']
+      >>> [person.name for person in people.page(after_key=u'anna', limit=2)]
+      [u'bob', u'carl']
+      >>> [person.name for person in people.page(after_key=u'carl', limit=2)]
+      [u'cindy']
+
+    The items are located like all other items of the container:
+
+      >>> people.page(limit=1)[0].__parent__ is people
+      True
+
+    Pages can also be computed in reverse order:
+
+      >>> [person.name
+      ...  for person in people.page(after_key=u'carl', reverse=True)]
+      [u'bob', u'anna', u'adam']
+
+    Keys can be looked up by range and by prefix:
+
+      >>> people.keys_between(u'anna', u'carl')
+      [u'anna', u'bob']
+      >>> people.keys_between(low=u'c')
+      [u'carl', u'cindy']
+      >>> people.keys_with_prefix(u'a')
+      [u'adam', u'anna']
+      >>> people.keys_with_prefix(u'x')
+      []
+
+    For containers using object ids as keys, the prefix is a range of ids:
+
+      >>> dm.root['c'] = c = container.IdNamesMongoContainer('person')
+      >>> c[u'4e7ddf12e138237403000000'] = PeoplePerson('one', 1)
+      >>> c[u'4e7ddf12e138237403000001'] = PeoplePerson('two', 2)
+      >>> c[u'4f7ddf12e138237403000000'] = PeoplePerson('three', 3)
+      >>> c.keys_with_prefix(u'4e7d')
+      [u'4e7ddf12e138237403000000', u'4e7ddf12e138237403000001']
+      >>> [person.name for person in c.page(u'4e7ddf12e138237403000000')]
+      ['two', 'three']
+    """
+
+
+def doctest_MongoContainer_find_ghost():
+    """MongoContainer: find() returning true ghosts
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = People()
+      >>> for idx in xrange(3):
+      ...     people[None] = PeoplePerson('Mr Number %.5i' %idx, idx)
+      >>> transaction.commit()
+
+    When most of the found objects are not going to be used, it is cheaper to
+    only request the id and key of the documents:
+
+      >>> people = dm.root['people']
+      >>> found = list(people.find({'age': {'$gt': 0}}, ghost=True))
+      >>> [person._p_changed for person in found]
+      [None, None]
+
+    The partial documents are not used as the states of the objects:
+
+      >>> [ref for ref in dm._latest_states if ref.collection == 'person']
+      []
+
+    The state is only loaded when an object is used:
+
+      >>> [person.__name__ for person in found]
+      [u'Mr Number 00001', u'Mr Number 00002']
+      >>> found[0].age
+      1
+
+    The same is true for ``find_one()`` and queries using explicit fields:
+
+      >>> transaction.commit()
+      >>> people = dm.root['people']
+      >>> person = people.find_one({'age': 0}, fields=['name'])
+      >>> person._p_changed is None
+      True
+      >>> person.age
+      0
+    """
+
+
 def doctest_firing_events_MongoContainer():
     """Events need to be fired when _m_mapping_key is already set on the object
     and the object gets added to the container
@@ -1348,6 +2202,169 @@ def doctest_firing_events_IdNamesMongoContainer():
 
     """
 
+def doctest_dublincore_queries():
+    """Dublin Core: normalized storage and queries
+
+    The Dublin Core dates and creators are stored as native values, so that
+    they can be queried and indexed:
+
+      >>> import datetime
+      >>> from zope.datetime import tzinfo
+
+      >>> transaction.commit()
+      >>> dm.root['people'] = people = container.MongoContainer('person')
+      >>> for idx, name in enumerate([u'stephan', u'roy', u'adam']):
+      ...     people[name] = Person(name.title())
+      ...     dc = dublincore.ZDCAnnotatableAdapter(people[name])
+      ...     dc.created = datetime.datetime(2013, 1, idx+1, 12, 0, 0, 1234,
+      ...                                    tzinfo=tzinfo(120))
+      ...     dc.modified = datetime.datetime(2013, 2, 3-idx, 12, 0,
+      ...                                     tzinfo=tzinfo(0))
+      ...     dc.creators = [u'srichter']
+      >>> transaction.commit()
+
+      >>> doc = conn[DBNAME]['person'].find_one({'name': 'Stephan'})
+      >>> sorted(doc['dc'])
+      [u'created', u'creators', u'modified']
+      >>> doc['dc']['created'].isoformat()
+      '2013-01-01T10:00:00.001000'
+      >>> doc['dc']['creators']
+      [u'srichter']
+
+    Reading the data returns the Dublin Core values in UTC:
+
+      >>> dc = dublincore.ZDCAnnotatableAdapter(people[u'stephan'])
+      >>> dc.created.isoformat()
+      '2013-01-01T10:00:00.001000+00:00'
+      >>> dc.creators
+      (u'srichter',)
+      >>> sorted(dc._mapping.keys())
+      [u'Creator', u'Date.Created', u'Date.Modified']
+
+    Values that cannot be normalized and data stored before the normalized
+    fields existed are stored by their mangled keys:
+
+      >>> dc._mapping['Date.Created'] = (u'2013-01-01', u'2013-01-02')
+      >>> dc._mapping['Date.Created']
+      (u'2013-01-01', u'2013-01-02')
+      >>> sorted(dc._mapping.data)
+      [u'Date_Created', u'creators', u'modified']
+      >>> dc.title = u'Stephan'
+      >>> dc._mapping['Title']
+      (u'Stephan',)
+      >>> transaction.abort()
+
+    The items of a container can be queried by their modification date:
+
+      >>> [person.name for person in dublincore.recently_modified(people)]
+      [u'Stephan', u'Roy', u'Adam']
+      >>> [person.name
+      ...  for person in dublincore.recently_modified(people, limit=2)]
+      [u'Stephan', u'Roy']
+
+    or by their creation date:
+
+      >>> [person.name for person in dublincore.created_between(
+      ...     people, start=datetime.datetime(2013, 1, 2))]
+      [u'Roy', u'Adam']
+      >>> [person.name for person in dublincore.created_between(
+      ...     people, end=datetime.datetime(2013, 1, 3), limit=1)]
+      [u'Stephan']
+
+    The queries are covered by these indexes:
+
+      >>> dublincore.get_indexes('parent')
+      [[('parent', 1), ('dc.modified', -1)], [('parent', 1), ('dc.created', 1)]]
+    """
+
+def doctest_DocumentAnnotations():
+    """DocumentAnnotations: annotations in a separate document
+
+    The document annotations adapter stores the annotations of an object in
+    a separate document, so that they are neither loaded nor written with the
+    object itself:
+
+      >>> zope.component.provideAdapter(annotation.DocumentAnnotations)
+      >>> from zope.annotation.interfaces import IAnnotations
+
+      >>> dm.root['stephan'] = stephan = SimplePerson('Stephan')
+      >>> zope.interface.alsoProvides(
+      ...     stephan, annotation.IMongoDocumentAnnotatable)
+      >>> transaction.commit()
+
+    Initially there are no annotations and nothing is stored:
+
+      >>> annotations = IAnnotations(dm.root['stephan'])
+      >>> len(annotations)
+      0
+      >>> annotations.get('my.note') is None
+      True
+
+    Let's now add an annotation:
+
+      >>> annotations['my.note'] = u'Hello'
+      >>> annotations['my.note']
+      u'Hello'
+      >>> transaction.commit()
+
+    The owner's document is unchanged, while the annotations are stored in
+    their own document:
+
+      >>> sorted(conn[DBNAME]['person'].find_one())
+      [u'__provides__', u'_id', u'name']
+      >>> doc = conn[DBNAME]['persistence_annotations'].find_one()
+      >>> sorted(doc)
+      [u'_id', u'data', u'owner']
+      >>> doc['owner'] == stephan._p_oid
+      True
+
+    The annotations are loaded once per transaction:
+
+      >>> stephan = dm.root['stephan']
+      >>> annotations = IAnnotations(stephan)
+      >>> len(annotations)
+      1
+      >>> stephan._p_oid in dm.annotations
+      True
+      >>> list(IAnnotations(stephan))
+      [u'my.note']
+
+    Removing an annotation does not change the owner:
+
+      >>> del annotations['my.note']
+      >>> stephan._p_changed
+      False
+      >>> transaction.commit()
+      >>> len(IAnnotations(dm.root['stephan']))
+      0
+
+    Objects that are not stored yet cannot be annotated:
+
+      >>> anonymous = SimplePerson('Anonymous')
+      >>> zope.interface.alsoProvides(
+      ...     anonymous, annotation.IMongoDocumentAnnotatable)
+      >>> list(IAnnotations(anonymous))
+      []
+      >>> IAnnotations(anonymous)['my.note'] = u'Hello'
+      Traceback (most recent call last):
+      ...
+      ValueError: ('The annotated object must be stored first.', <SimplePerson Anonymous>)
+
+    Classes can have their annotations removed along with their objects:
+
+      >>> dm.root['roy'] = roy = AnnotatedPerson('Roy')
+      >>> transaction.commit()
+      >>> IAnnotations(dm.root['roy'])['my.note'] = u'Hello'
+      >>> transaction.commit()
+      >>> conn[DBNAME]['persistence_annotations'].count()
+      2
+
+      >>> dm.remove(dm.root['roy'])
+      >>> transaction.commit()
+      >>> conn[DBNAME]['persistence_annotations'].count()
+      1
+    """
+
 checker = renormalizing.RENormalizing([
     (re.compile(r'datetime.datetime(.*)'),
      'datetime.datetime(2011, 10, 1, 9, 45)'),
@@ -1408,6 +2425,9 @@ def tearDown(test):
     testing.cleanDB(test.globs['conn'], test.globs['DBNAME'])
     test.globs['conn'].disconnect()
     testing.resetCaches()
+    container.USE_KEY_CACHE = False
+    container.CONTAINER_CACHE_SIZE = 10000
+    container.invalidate_key_cache()
     exceptionformatter.DEBUG_EXCEPTION_FORMATTER = \
         test.orig_DEBUG_EXCEPTION_FORMATTER
 